@@ -5,7 +5,7 @@ This module computes and generates a CDO table by comparing model output data
 against perturbed model data.
 """
 
-import tempfile
+import sys
 from pathlib import Path
 
 import click
@@ -13,12 +13,12 @@ import numpy as np
 import pandas as pd
 import xarray as xr
 
-from util import model_output_parser
 from util.click_util import cli_help
 from util.constants import cdo_bins
-from util.dataframe_ops import df_from_file_ids
+from util.dataframe_ops import unify_time_index
 from util.file_system import file_names_from_pattern
 from util.log_handler import logger
+from util.model_output_parser import get_variables
 from util.utils import prepend_type_to_member_id
 
 
@@ -38,6 +38,27 @@ def compute_rel_diff(var1, var2):
     return rel_diff
 
 
+def histograms(data, bins, valid=None):
+    """
+    Compute the histogram of each row of the 2-d array data like np.histogram
+    with the bin edges bins, for all rows at once. Values outside the bins,
+    NaNs and values where valid is False are not counted.
+    """
+    nrow = data.shape[0]
+    nbin = len(bins) - 1
+
+    # 0: below the bins, 1..nbin: bins, nbin + 1: above the bins or not counted
+    bin_index = np.searchsorted(bins, data, side="right")
+    # like np.histogram, the last bin includes its right edge
+    bin_index[data == bins[-1]] = nbin
+    if valid is not None:
+        np.putmask(bin_index, ~valid, nbin + 1)
+
+    bin_index += (np.arange(nrow) * (nbin + 2))[:, np.newaxis]
+    counts = np.bincount(bin_index.ravel(), minlength=nrow * (nbin + 2))
+    return counts.reshape(nrow, nbin + 2)[:, 1 : nbin + 1]
+
+
 def rel_diff_stats(
     file_id,
     filename,
@@ -55,20 +76,16 @@ def rel_diff_stats(
     dims_without_time = [d for d in dims if d != time_dim]
     amax = dataarray.max(dim=dims_without_time)
 
-    # allocate empty matrix
-    ncol = 9
-    matrix = np.empty((amax.size * ncol))
+    # compute histogram of relative differences of all time steps at once
+    data = dataarray.transpose(time_dim, ...).values
+    data = data.reshape(amax.size, int(np.prod(data.shape[1:])))
+    valid = None
+    if fill_value_key and fill_value_key in dataarray.attrs:
+        valid = data != dataarray.attrs[fill_value_key]
+    hist = histograms(data, np.array([0] + cdo_bins), valid)
 
-    # compute histogram of relative differences
-    for i in range(amax.size):
-        data = dataarray[{time_dim: i}].values.flatten()
-        if fill_value_key and fill_value_key in dataarray.attrs:
-            mask = data != dataarray.attrs[fill_value_key]
-            data = data[mask]
-
-        hist, _ = np.histogram(data, bins=[0] + cdo_bins)
-        matrix[i * ncol] = amax[i]
-        matrix[i * ncol + 1 : i * ncol + ncol] = hist
+    # one row of rel_diff followed by the histogram per time step
+    matrix = np.column_stack([amax.values, hist]).ravel()
 
     index = pd.MultiIndex.from_product(
         [[file_id], [varname]], names=("file_ID", "variable")
@@ -80,6 +97,121 @@ def rel_diff_stats(
     return pd.DataFrame(matrix[np.newaxis, :], index=index, columns=columns)
 
 
+def rel_diff_variable(ref_data, perturb_data, varname):
+    """
+    Return the relative difference of the variable varname in ref_data and
+    perturb_data as a float64 DataArray. Variables without a time dimension or
+    missing in perturb_data are returned with their reference values.
+    """
+    ref_var = ref_data[varname]
+    values = ref_var.values
+    if (
+        varname in ref_data.data_vars
+        and "time" in ref_var.dims
+        and (pert_var := perturb_data.variables.get(varname)) is not None
+    ):
+        # computed in the data type of the variable, as if it was stored
+        values = compute_rel_diff(values, pert_var.values)
+    if np.issubdtype(values.dtype, np.floating):
+        values = values.astype(np.float64)
+
+    # keep the fill value of the variable, which is decoded into its encoding
+    attrs = dict(ref_var.attrs)
+    attrs.update(
+        {
+            k: ref_var.encoding[k]
+            for k in ("_FillValue", "missing_value")
+            if k in ref_var.encoding
+        }
+    )
+    return ref_var.copy(data=values).assign_attrs(attrs)
+
+
+def rel_diff_dataframes(file_id, ref_file, perturb_file, specification):
+    """
+    Compute the rel-diff statistics of all variables of a reference and a
+    perturbed NetCDF file, one variable at a time.
+    """
+    time_dim = specification["time_dim"]
+    horizontal_dims = specification["horizontal_dims"]
+    fill_value_key = specification.get("fill_value_key", None)
+
+    # times are not decoded, as in the files parsed by the stats
+    with (
+        xr.open_dataset(ref_file, decode_times=False) as ref_data,
+        xr.open_dataset(perturb_file, decode_times=False) as perturb_data,
+    ):
+        var_dfs = []
+        for v in get_variables(ref_data, time_dim, horizontal_dims):
+            diff = rel_diff_variable(ref_data, perturb_data, v)
+            var_dfs.append(
+                rel_diff_stats(
+                    file_id,
+                    ref_file,
+                    v,
+                    time_dim,
+                    horizontal_dims,
+                    xr.Dataset({v: diff}),
+                    fill_value_key,
+                )
+            )
+
+    if len(var_dfs) == 0:
+        logger.error("Could not find any variables in `%s`", ref_file)
+        logger.error("Wrong file format or specification? Fid: `%s` ", file_id)
+        sys.exit(1)
+
+    return pd.concat(var_dfs, axis=0)
+
+
+def rel_diff_dataframe(
+    file_id, model_output_dir, perturbed_model_output_dir, file_specification
+):
+    """
+    Compute the rel-diff statistics of the reference and perturbed model
+    output, combined like df_from_file_ids combines the stats of model output.
+    The relative differences are reduced to statistics right away and never
+    written to disk.
+    """
+    fid_dfs = []
+    for file_type, file_pattern in file_id:
+        ref_files, err = file_names_from_pattern(model_output_dir, file_pattern)
+        if err > 0:
+            logger.info(
+                "did not find any files for pattern %s. Continue.", file_pattern
+            )
+            continue
+        ref_files.sort()
+        perturb_files, err = file_names_from_pattern(
+            perturbed_model_output_dir, file_pattern
+        )
+        if err > 0:
+            logger.info(
+                "did not find any files for pattern %s. Continue.", file_pattern
+            )
+            continue
+        perturb_files.sort()
+
+        file_dfs = [
+            rel_diff_dataframes(
+                f"{file_type}:{file_pattern}",
+                f"{model_output_dir}/{rf}",
+                f"{perturbed_model_output_dir}/{pf}",
+                file_specification[file_type],
+            )
+            for rf, pf in zip(ref_files, perturb_files)
+            if rf.endswith(".nc") and pf.endswith(".nc")
+        ]
+        if file_dfs:
+            fid_dfs.append(pd.concat(file_dfs, axis=1))
+
+    if len(fid_dfs) == 0:
+        logger.error("Could not find any file.")
+        sys.exit(2)
+
+    return pd.concat(unify_time_index(fid_dfs), axis=0)
+
+
 @click.command()
 @click.option(
     "--model-output-dir",
@@ -131,75 +263,22 @@ def cdo_table(
     file_specification = file_specification[0]  # can't store dicts as defaults in click
     assert isinstance(file_specification, dict), "must be dict"
 
-    # save original method and restore at the end of this module
-    dataframe_from_ncfile_orig = model_output_parser.dataframe_from_ncfile
-    # modify netcdf parse method:
-    model_output_parser.dataframe_from_ncfile = rel_diff_stats
-
-    # step 1: compute rel-diff netcdf files
-    with tempfile.TemporaryDirectory() as tmpdir:
-        typed_member_id = prepend_type_to_member_id(member_type, member_id)
-        for _, file_pattern in file_id:
-            ref_files, err = file_names_from_pattern(model_output_dir, file_pattern)
-            if err > 0:
-                logger.info(
-                    "did not find any files for pattern %s. Continue.", file_pattern
-                )
-                continue
-            ref_files.sort()
-            perturb_files, err = file_names_from_pattern(
-                perturbed_model_output_dir.format(member_id=typed_member_id),
-                file_pattern,
-            )
-            if err > 0:
-                logger.info(
-                    "did not find any files for pattern %s. Continue.", file_pattern
-                )
-                continue
-            perturb_files.sort()
-
-            for rf, pf in zip(ref_files, perturb_files):
-                if not rf.endswith(".nc") or not pf.endswith(".nc"):
-                    continue
-                ref_data = xr.open_dataset(f"{model_output_dir}/{rf}")
-                perturb_data = xr.open_dataset(
-                    f"{perturbed_model_output_dir.format(member_id=typed_member_id)}"
-                    f"/{pf}"
-                )
-                diff_data = ref_data.copy()
-                varnames = [
-                    v
-                    for v in list(ref_data.keys())
-                    if (var := ref_data.variables.get(v)) is not None
-                    and "time" in var.dims
-                ]
-
-                for v in varnames:
-                    if (ref_var := ref_data.variables.get(v)) is not None and (
-                        pert_var := perturb_data.variables.get(v)
-                    ) is not None:
-                        diff_data.variables[v].values = compute_rel_diff(
-                            ref_var.values,
-                            pert_var.values,
-                        )
-
-                diff_data.to_netcdf(f"{tmpdir}/{rf}")
-                ref_data.close()
-                perturb_data.close()
-                diff_data.close()
-
-        # step 2: generate dataframe from precomputed relative differences
-        df = df_from_file_ids(file_id, tmpdir, file_specification)
-
-        # normalize histogram component of DataFrame
-        times = np.array(df.columns.levels[0], dtype=int)
-        for t in times:
-            df.loc[:, (t, cdo_bins)] = df.loc[:, (t, cdo_bins)].div(
-                df.loc[:, (t, cdo_bins)].sum(axis=1), axis=0
-            )
+    typed_member_id = prepend_type_to_member_id(member_type, member_id)
+    df = rel_diff_dataframe(
+        file_id,
+        model_output_dir,
+        perturbed_model_output_dir.format(member_id=typed_member_id),
+        file_specification,
+    )
+
+    # normalize histogram component of DataFrame
+    times = np.array(df.columns.levels[0], dtype=int)
+    for t in times:
+        df.loc[:, (t, cdo_bins)] = df.loc[:, (t, cdo_bins)].div(
+            df.loc[:, (t, cdo_bins)].sum(axis=1), axis=0
+        )
 
-        logger.info("writing cdo table to %s.", cdo_table_file)
+    logger.info("writing cdo table to %s.", cdo_table_file)
 
-        Path(cdo_table_file).parent.mkdir(parents=True, exist_ok=True)
-        df.to_csv(cdo_table_file)
-        model_output_parser.dataframe_from_ncfile = dataframe_from_ncfile_orig
+    Path(cdo_table_file).parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(cdo_table_file)
@@ -9,15 +9,88 @@ tolerances and computing divergence between DataFrames.
 
 import json
 import sys
+from multiprocessing import Pool
 
 import click
 
 from util.click_util import CommaSeparatedStrings, cli_help
-from util.dataframe_ops import check_file_with_tolerances, compute_division
+from util.dataframe_ops import (
+    check_file_with_tolerances,
+    compute_division,
+    enable_persistent_parse_cache,
+)
+from util.fof_utils import MAX_LOGGED_DIFFERENCES
 from util.log_handler import log_dataframe, logger
+from util.parse_cache import DEFAULT_CACHE_MAX_SIZE_MB
 from util.utils import FileInfo, expand_fof
 
 
+def check_files(args):
+    """
+    Check one (tolerance, reference, current) triple given by args, which also
+    holds the remaining arguments of check_file_with_tolerances. An abort of
+    the check is returned instead of raised so that it can be passed back from
+    a worker process and be handled in the order of the input.
+    """
+    tolerance_file, reference_file, current_file, factor, kwargs = args
+    try:
+        return check_file_with_tolerances(
+            tolerance_file,
+            FileInfo(reference_file),
+            FileInfo(current_file),
+            factor,
+            **kwargs,
+        )
+    except SystemExit as e:
+        return e
+
+
+def log_check_result(  # pylint: disable=too-many-positional-arguments
+    name, out, err, tol, verbose, summary_only
+):
+    """Log whether the check of name passed and, if not, its differences."""
+    if out:
+        logger.info("RESULT: check PASSED for %s", name)
+        return
+
+    logger.info("RESULT: check FAILED for %s", name)
+    if not summary_only:
+        log_dataframe(logger, "Differences", err, verbose=verbose)
+        log_dataframe(logger, "\nTolerances", tol, verbose=verbose)
+        log_dataframe(
+            logger,
+            "\nError relative to tolerance",
+            compute_division(err, tol),
+            verbose=verbose,
+        )
+
+
+def report_results(check_args, results, verbose, summary_only, fail_fast):
+    """
+    Log the results of the checks in the order of the input and return
+    whether all of them passed. With fail_fast, stop at the first failure.
+    """
+    all_out = True
+
+    for (_, _, current_file, _, _), result in zip(check_args, results):
+
+        if isinstance(result, SystemExit):
+            raise result
+
+        out, err, tol = result
+
+        log_check_result(current_file, out, err, tol, verbose, summary_only)
+        if out:
+            continue
+        all_out = False
+
+        if fail_fast:
+            logger.info("stopping at the first failure (--fail-fast)")
+            break
+
+    return all_out
+
+
 @click.command()
 @click.option(
     "--reference-files",
@@ -49,11 +122,46 @@ from util.utils import FileInfo, expand_fof
     default="{}",
     help=cli_help["rules"],
 )
+@click.option(
+    "--max-logged-differences",
+    type=int,
+    default=MAX_LOGGED_DIFFERENCES,
+    help=cli_help["max_logged_differences"],
+)
 @click.option(
     "--verbose",
     is_flag=True,
     help=cli_help["verbose"],
 )
+@click.option(
+    "--fail-fast",
+    is_flag=True,
+    help=cli_help["fail_fast"],
+)
+@click.option(
+    "--summary-only",
+    is_flag=True,
+    help=cli_help["summary_only"],
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help=cli_help["jobs"],
+)
+@click.option(
+    "--cache-dir",
+    envvar="PROBTEST_CACHE_DIR",
+    default=None,
+    help=cli_help["cache_dir"],
+)
+@click.option(
+    "--cache-max-size",
+    envvar="PROBTEST_CACHE_MAX_SIZE",
+    type=float,
+    default=DEFAULT_CACHE_MAX_SIZE_MB,
+    help=cli_help["cache_max_size"],
+)
 def check(
     reference_files,
     current_files,
@@ -61,39 +169,57 @@ def check(
     factor,
     fof_types,
     rules: str,
+    max_logged_differences: int,
     verbose: bool,
+    fail_fast: bool,
+    summary_only: bool,
+    jobs: int,
+    cache_dir,
+    cache_max_size: float,
 ):  # pylint: disable=too-many-positional-arguments
 
+    enable_persistent_parse_cache(cache_dir, cache_max_size)
+
     parsed_rules = json.loads(rules)
 
     zipped = zip(reference_files, current_files, tolerance_files)
 
     expanded_zip = expand_fof(zipped, fof_types)
 
-    all_out = True
-
-    for reference_file, current_file, tolerance_file in expanded_zip:
-
-        out, err, tol = check_file_with_tolerances(
+    check_args = [
+        (
             tolerance_file,
-            FileInfo(reference_file),
-            FileInfo(current_file),
+            reference_file,
+            current_file,
             factor,
-            rules=parsed_rules,
+            {
+                "rules": parsed_rules,
+                "max_logged_differences": max_logged_differences,
+                "fail_fast": fail_fast,
+                "summary_only": summary_only,
+            },
         )
+        for reference_file, current_file, tolerance_file in expanded_zip
+    ]
 
-        if out:
-            logger.info("RESULT: check PASSED for %s", current_file)
-        else:
-            logger.info("RESULT: check FAILED for %s", current_file)
-            log_dataframe(logger, "Differences", err, verbose=verbose)
-            log_dataframe(logger, "\nTolerances", tol, verbose=verbose)
-            log_dataframe(
-                logger,
-                "\nError relative to tolerance",
-                compute_division(err, tol),
-                verbose=verbose,
+    if jobs > 1 and len(check_args) > 1:
+        # imap returns the results in the order of the input, leaving the
+        # context terminates the workers still running after a fail-fast stop
+        with Pool(jobs) as p:
+            all_out = report_results(
+                check_args,
+                p.imap(check_files, check_args),
+                verbose,
+                summary_only,
+                fail_fast,
             )
-            all_out = False
+    else:
+        all_out = report_results(
+            check_args,
+            (check_files(args) for args in check_args),
+            verbose,
+            summary_only,
+            fail_fast,
+        )
 
     sys.exit(0 if all_out else 1)
@@ -0,0 +1,150 @@
+"""
+CLI for checking model output against a reference stats file
+
+This module combines `stats` and `check`: the statistics of the current model
+output are computed in memory and compared directly to the reference and the
+tolerances, without writing and re-reading an intermediate stats file.
+Optionally, the stats file is still written in the background for archiving.
+"""
+
+import os
+import sys
+import threading
+
+import click
+
+from engine.check import log_check_result
+from engine.stats import write_stats_file
+from util.click_util import CommaSeparatedStrings, cli_help
+from util.dataframe_ops import (
+    check_stats_with_tolerances,
+    df_from_file_ids,
+    parse_cached,
+    parse_probtest_stats,
+    sort_stats_columns,
+)
+from util.log_handler import logger
+from util.utils import validate_single_stats_file
+
+
+@click.command()
+@click.option(
+    "--model-output-dir",
+    help=cli_help["model_output_dir"],
+)
+@click.option(
+    "--file-id",
+    nargs=2,
+    type=str,
+    multiple=True,
+    metavar="FILE_TYPE FILE_PATTERN",
+    help=cli_help["file_id"],
+)
+@click.option(
+    "--file-specification",
+    type=list,
+    help=cli_help["file_specification"],
+)
+@click.option(
+    "--reference-files",
+    type=CommaSeparatedStrings(),
+    default=[],
+    help=cli_help["reference_files"]
+    + "\nNote: this option accepts exactly one stats file.",
+)
+@click.option(
+    "--tolerance-files",
+    type=CommaSeparatedStrings(),
+    default=[],
+    help=cli_help["tolerance_files_input"]
+    + "\nNote: this option accepts exactly one stats file.",
+)
+@click.option("--factor", type=float, help=cli_help["factor"])
+@click.option(
+    "--stats-file-name",
+    default=None,
+    help=cli_help["archive_stats_file_name"],
+)
+@click.option(
+    "--verbose",
+    is_flag=True,
+    help=cli_help["verbose"],
+)
+@click.option(
+    "--fail-fast",
+    is_flag=True,
+    help=cli_help["fail_fast"],
+)
+@click.option(
+    "--summary-only",
+    is_flag=True,
+    help=cli_help["summary_only"],
+)
+def check_output(
+    model_output_dir,
+    file_id,
+    file_specification,
+    reference_files,
+    tolerance_files,
+    factor,
+    stats_file_name,
+    verbose: bool,
+    fail_fast: bool,
+    summary_only: bool,
+):  # pylint: disable=too-many-positional-arguments
+    file_specification = file_specification[0]  # can't store dicts as defaults in click
+    assert isinstance(file_specification, dict), "must be dict"
+
+    errors: list[str] = []
+    reference_file = validate_single_stats_file(reference_files, "reference", errors)
+    tolerance_file = validate_single_stats_file(tolerance_files, "tolerance", errors)
+    if errors:
+        for msg in errors:
+            logger.error("ERROR: %s", msg)
+        sys.exit(1)
+
+    df_cur = df_from_file_ids(file_id, model_output_dir, file_specification)
+
+    writer = None
+    if stats_file_name:
+        writer = threading.Thread(
+            target=write_stats_file,
+            args=(
+                df_cur,
+                stats_file_name.format(
+                    member_id=os.path.basename(os.path.normpath(model_output_dir))
+                ),
+            ),
+        )
+        writer.start()
+
+    df_tol = parse_cached(
+        parse_probtest_stats, tolerance_file, persistent=True, index_col=[0, 1]
+    )
+    df_ref = parse_cached(
+        parse_probtest_stats, reference_file, persistent=True, index_col=[0, 1, 2]
+    )
+    df_tol = df_tol * factor
+
+    logger.info("applying a factor of %s to the spread", factor)
+    logger.info(
+        "checking %s against %s using tolerances from %s",
+        model_output_dir,
+        reference_file,
+        tolerance_file,
+    )
+
+    out, err, tol = check_stats_with_tolerances(
+        df_tol,
+        df_ref,
+        sort_stats_columns(df_cur),
+        fail_fast=fail_fast,
+        summary_only=summary_only,
+    )
+
+    log_check_result(model_output_dir, out, err, tol, verbose, summary_only)
+
+    if writer is not None:
+        writer.join()
+
+    sys.exit(0 if out else 1)
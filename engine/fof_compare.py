@@ -7,19 +7,91 @@ Veri data are not considered, only reports and observations are compared.
 """
 
 import json
-import tempfile
+from multiprocessing import Pool
 
 import click
-import pandas as pd
-import xarray as xr
 
+from util.checksum import files_identical, identical_variables
 from util.click_util import CommaSeparatedStrings, cli_help
-from util.dataframe_ops import check_file_with_tolerances
+from util.dataframe_ops import check_fof_datasets_with_tolerances
 from util.fof_utils import (
+    MAX_LOGGED_DIFFERENCES,
+    get_detailed_logger_name,
     get_log_file_name,
+    open_feedback_dataset,
 )
-from util.log_handler import initialize_detailed_logger, logger
-from util.utils import FileInfo
+from util.log_handler import (
+    capture_log_records,
+    close_detailed_logger,
+    initialize_detailed_logger,
+    logger,
+    replay_log_records,
+)
+
+
+def compare_fof_files(args):
+    """
+    Compare the pair of fof files of one fof type given by args and write the
+    veri data outside of the tolerance range to the detailed log file.
+    Files or variables which are bit-identical are not compared in full.
+    The messages logged are collected and returned with the result, so that
+    fof types compared in worker processes can be reported in the order of
+    the input.
+    """
+    file1_path, file2_path, tolerance, rules, max_logged_differences = args
+    log_file_name = get_log_file_name(file1_path)
+
+    with capture_log_records() as records:
+        if files_identical(file1_path, file2_path):
+            logger.info("Files are identical, skipping the comparison")
+            logger.info("Files are consistent!")
+            return True, records
+
+        with (
+            open_feedback_dataset(file1_path) as ds1,
+            open_feedback_dataset(file2_path) as ds2,
+        ):
+            if ds1.sizes["d_body"] != ds2.sizes["d_body"]:
+                raise ValueError("Files have different numbers of lines!")
+
+            identical = identical_variables(ds1, ds2)
+            if identical == set(ds1.data_vars) == set(ds2.data_vars):
+                logger.info("All variables are identical, skipping the comparison")
+                logger.info("Files are consistent!")
+                return True, records
+
+            out, err, tol = check_fof_datasets_with_tolerances(
+                ds1,
+                ds2,
+                tolerance,
+                log_file_name,
+                rules=rules,
+                max_logged_differences=max_logged_differences,
+                identical_variables=identical,
+            )
+
+        if out:
+            logger.info("Files are consistent!")
+
+        else:
+            logger.info("Files are NOT consistent!")
+
+            logger.info("Complete output available in %s", log_file_name)
+            if not err.empty:
+                detailed_logger = initialize_detailed_logger(
+                    get_detailed_logger_name(log_file_name),
+                    log_level="DEBUG",
+                    log_file=log_file_name,
+                )
+
+                detailed_logger.info(
+                    "Differences, veri_data outside of tolerance range"
+                )
+                detailed_logger.info(err)
+                detailed_logger.info(tol)
+                close_detailed_logger(detailed_logger)
+
+    return out, records
 
 
 @click.command()
@@ -49,52 +121,51 @@ from util.utils import FileInfo
     type=str,
     help=cli_help["rules"],
 )
-def fof_compare(file1, file2, fof_types, tolerance, rules: str):
+@click.option(
+    "--max-logged-differences",
+    type=int,
+    default=MAX_LOGGED_DIFFERENCES,
+    help=cli_help["max_logged_differences"],
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help=cli_help["jobs"],
+)
+def fof_compare(
+    file1,
+    file2,
+    fof_types,
+    tolerance,
+    rules: str,
+    max_logged_differences: int,
+    jobs: int,
+):  # pylint: disable=too-many-positional-arguments
 
     parsed_rules = json.loads(rules)
 
-    for fof_type in fof_types:
-        file1_path = file1.format(fof_type=fof_type)
-        file2_path = file2.format(fof_type=fof_type)
-
-        n_rows_file1 = xr.open_dataset(file1_path).sizes["d_body"]
-        n_rows_file2 = xr.open_dataset(file2_path).sizes["d_body"]
-
-        if n_rows_file1 != n_rows_file2:
-            raise ValueError("Files have different numbers of lines!")
-
-        with tempfile.NamedTemporaryFile(
-            mode="w", suffix=".csv", delete=True, dir="/dev/shm"
-        ) as tmp:
-            df = pd.DataFrame({"tolerance": [tolerance] * n_rows_file1})
-            df.to_csv(tmp.name)
-
-            out, err, tol = check_file_with_tolerances(
-                tmp.name,
-                FileInfo(file1_path),
-                FileInfo(file2_path),
-                factor=1,
-                rules=parsed_rules,
-            )
-
-            if out:
-                logger.info("Files are consistent!")
-
-            else:
-                logger.info("Files are NOT consistent!")
-
-                log_file_name = get_log_file_name(file1_path)
-                logger.info("Complete output available in %s", log_file_name)
-                if not err.empty:
-                    detailed_logger = initialize_detailed_logger(
-                        "DETAILS", log_level="DEBUG", log_file=log_file_name
-                    )
-
-                    detailed_logger.info(
-                        "Differences, veri_data outside of tolerance range"
-                    )
-                    detailed_logger.info(err)
-                    detailed_logger.info(tol)
+    compare_args = [
+        (
+            file1.format(fof_type=fof_type),
+            file2.format(fof_type=fof_type),
+            tolerance,
+            parsed_rules,
+            max_logged_differences,
+        )
+        for fof_type in fof_types
+    ]
+
+    if jobs > 1 and len(compare_args) > 1:
+        # each fof type writes its own detailed log file; imap returns the
+        # results in the order of the input
+        with Pool(jobs) as p:
+            for _, records in p.imap(compare_fof_files, compare_args):
+                replay_log_records(records)
+    else:
+        for args in compare_args:
+            _, records = compare_fof_files(args)
+            replay_log_records(records)
 
 
 if __name__ == "__main__":
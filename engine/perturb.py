@@ -9,24 +9,154 @@ This command line tool provides functionality for:
 """
 
 import os
-import shutil
+from multiprocessing import Pool
 
 import click
 import numpy as np
 
 from util.click_util import CommaSeparatedInts, CommaSeparatedStrings, cli_help
+from util.file_links import LINK_MODES, link_file
 from util.log_handler import logger
 from util.netcdf_io import nc4_get_copy
+from util.pattern_store import PatternStore
 from util.utils import get_seed_from_member_id, prepend_type_to_member_id
 
+# number of values of the perturbation drawn and applied at once
+PERTURB_BLOCK_SIZE = 1 << 20
 
-def perturb_array(array, seed, perturb_amplitude):
+
+def perturbation_pattern(shape, seed, perturb_amplitude):
+    """Return the multiplicative perturbation applied by perturb_array."""
     np.random.seed(seed)
     # *2-1: map to [-1,1)
     # *perturb_amplitude: rescale to perturbation amplitude
     # +1 perturb around 1
-    perturbation = (np.random.rand(*array.shape) * 2 - 1) * perturb_amplitude + 1
-    return np.copy(array * perturbation)
+    perturbation = np.random.rand(*shape)
+    perturbation *= 2
+    perturbation -= 1
+    perturbation *= perturb_amplitude
+    perturbation += 1
+    return perturbation
+
+
+def perturbation_pattern_philox(shape, seed, perturb_amplitude):
+    """Return the multiplicative perturbation applied by perturb_array_inplace."""
+    rng = np.random.Generator(np.random.Philox(key=seed))
+    perturbation = rng.random(int(np.prod(shape))).reshape(shape)
+    perturbation *= 2
+    perturbation -= 1
+    perturbation *= perturb_amplitude
+    perturbation += 1
+    return perturbation
+
+
+def perturb_array(array, seed, perturb_amplitude):
+    perturbation = perturbation_pattern(array.shape, seed, perturb_amplitude)
+    # like a copy, asarray drops the mask of masked arrays
+    return np.asarray(array * perturbation)
+
+
+def perturb_array_inplace(
+    array, seed, perturb_amplitude, block_size=PERTURB_BLOCK_SIZE
+):
+    """
+    Perturb array in place like perturb_array, but with the counter-based
+    Philox generator keyed by seed instead of the global NumPy random state.
+    The perturbation is drawn and applied block by block, so that only one
+    block is held in memory at a time. The stream of random numbers is consumed
+    in the order of the (flattened) array, so the result does not depend on
+    block_size. Masked values, e.g. fill values, are kept unchanged like in
+    perturb_array. Returns the perturbed data, without the mask of masked arrays.
+    """
+    rng = np.random.Generator(np.random.Philox(key=seed))
+    data = np.ma.getdata(array)
+    flat = data.reshape(-1)
+    if not np.shares_memory(flat, data):
+        raise ValueError("perturb_array_inplace needs a contiguous array")
+    mask = np.ma.getmask(array)
+    unmasked = None if mask is np.ma.nomask else ~mask.reshape(-1)
+
+    for start in range(0, flat.size, block_size):
+        perturbation = rng.random(min(block_size, flat.size - start))
+        perturbation *= 2
+        perturbation -= 1
+        perturbation *= perturb_amplitude
+        perturbation += 1
+        block = flat[start : start + perturbation.size]
+        if unmasked is None:
+            block *= perturbation
+        else:
+            np.multiply(
+                block,
+                perturbation,
+                out=block,
+                where=unmasked[start : start + perturbation.size],
+            )
+
+    return data
+
+
+def perturb_member(args):
+    """
+    Create the perturbed files of one ensemble member given by args, the tuple
+    (member_id, perturbed_dir, model_input_dir, files, variable_names,
+    perturb_amplitude, rng, copy_all_files, link_mode, pattern_store). The
+    files of a member only depend on its seed, so members can be processed in
+    any order and in any process. With a pattern_store directory, the
+    perturbation of each grid is generated once and applied to all variables
+    and files on that grid.
+    """
+    (
+        member_id,
+        perturbed_dir,
+        model_input_dir,
+        files,
+        variable_names,
+        perturb_amplitude,
+        rng,
+        copy_all_files,
+        link_mode,
+        pattern_store,
+    ) = args
+
+    seed = get_seed_from_member_id(member_id)
+    perturb_function = perturb_array_inplace if rng == "philox" else perturb_array
+    pattern_function = (
+        perturbation_pattern_philox if rng == "philox" else perturbation_pattern
+    )
+    patterns = None if pattern_store is None else PatternStore(pattern_store)
+
+    # Add perturbed files to member directory
+    for f in files:
+        d = nc4_get_copy(
+            f"{model_input_dir}/{f}",
+            f"{perturbed_dir}/{f}",
+            promote_variables=variable_names,
+        )
+        for vn in variable_names:
+            values = d.variables[vn][:]
+            if patterns is None:
+                values = perturb_function(
+                    values, seed=seed, perturb_amplitude=perturb_amplitude
+                )
+            else:
+                pattern = patterns.load(
+                    pattern_function, values.shape, seed, perturb_amplitude
+                )
+                values = np.asarray(values * pattern)
+            d.variables[vn][:] = values
+        d.close()
+
+    # Copy rest of the files in `model_input_dir` to the perturbed ensemble
+    # member dir (`perturbed_dir`)
+    if copy_all_files:
+        for f in os.listdir(model_input_dir):
+            if (
+                f not in files
+            ):  # files added manually via `files` flag already copied above
+                link_file(os.path.join(model_input_dir, f), perturbed_dir, link_mode)
+
+    return member_id
 
 
 @click.command()
@@ -66,11 +196,34 @@ def perturb_array(array, seed, perturb_amplitude):
     type=float,
     help=cli_help["perturb_amplitude"],
 )
+@click.option(
+    "--rng",
+    type=click.Choice(["legacy", "philox"]),
+    default="legacy",
+    help=cli_help["rng"],
+)
 @click.option(
     "--copy-all-files/--no-copy-all-files",
     is_flag=True,
     help=cli_help["copy_all_files"],
 )
+@click.option(
+    "--link-mode",
+    type=click.Choice(LINK_MODES),
+    default="copy",
+    help=cli_help["link_mode"],
+)
+@click.option(
+    "--pattern-store",
+    default=None,
+    help=cli_help["pattern_store"],
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help=cli_help["jobs"],
+)
 def perturb(
     experiment_name,
     model_input_dir,
@@ -80,9 +233,16 @@ def perturb(
     member_type,
     variable_names,
     perturb_amplitude,
+    rng,
     copy_all_files,
+    link_mode,
+    pattern_store,
+    jobs,
 ):  # pylint: disable=unused-argument, too-many-positional-arguments
 
+    model_input_dir_abspath = os.path.abspath(model_input_dir)
+    member_args = []
+
     # `member_id` is already an input option
     for _member_id in member_ids:
 
@@ -90,33 +250,33 @@ def perturb(
             member_id=prepend_type_to_member_id(member_type, _member_id)
         )
 
-        model_input_dir_abspath = os.path.abspath(model_input_dir)
-
         # Create directory for perturbed ensemble member
         if not os.path.exists(perturbed_dir):
             logger.info("creating new directory: %s", perturbed_dir)
             os.makedirs(perturbed_dir)
 
-        # Add perturbed files to member directory
-        data = [
-            nc4_get_copy(f"{model_input_dir_abspath}/{f}", f"{perturbed_dir}/{f}")
-            for f in files
-        ]
-
-        for d in data:
-            for vn in variable_names:
-                d.variables[vn][:] = perturb_array(
-                    array=d.variables[vn][:],
-                    seed=get_seed_from_member_id(_member_id),
-                    perturb_amplitude=perturb_amplitude,
-                )
-            d.close()
-
-        # Copy rest of the files in `model_input_dir` to the perturbed ensemble
-        # member dir (`perturbed_dir`)
-        if copy_all_files:
-            for f in os.listdir(model_input_dir_abspath):
-                if (
-                    f not in files
-                ):  # files added manually via `files` flag already copied above
-                    shutil.copy(os.path.join(model_input_dir, f), perturbed_dir)
+        member_args.append(
+            (
+                _member_id,
+                perturbed_dir,
+                model_input_dir_abspath,
+                files,
+                variable_names,
+                perturb_amplitude,
+                rng,
+                copy_all_files,
+                link_mode,
+                pattern_store,
+            )
+        )
+
+    if jobs > 1 and len(member_args) > 1:
+        # each worker holds the data of one member at a time and is handed the
+        # next member once it is done; the members do not depend on each other,
+        # so the output does not depend on the order in which they finish
+        with Pool(jobs) as p:
+            for _ in p.imap_unordered(perturb_member, member_args):
+                pass
+    else:
+        for args in member_args:
+            perturb_member(args)
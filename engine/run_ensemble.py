@@ -7,17 +7,22 @@ It allows users to execute a series of simulation runs by modifying the run
 scripts with specified perturbations and managing job submissions.
 """
 
+import json
 import os
 import re
 import subprocess
 import time
+from dataclasses import dataclass, field
+from multiprocessing import Pool
 from pathlib import Path
 from typing import List, Optional
 
 import click
 
+from engine.stats import create_stats_dataframe
 from util.click_util import CommaSeparatedInts, CommaSeparatedStrings, cli_help
 from util.log_handler import logger
+from util.parse_cache import file_content_hash
 from util.utils import get_seed_from_member_id, prepend_type_to_member_id
 
 
@@ -117,31 +122,249 @@ def prepare_perturbed_run_script(  # pylint: disable=too-many-positional-argumen
             logger.info("writing model run script to: %s", perturbed_runscript)
 
 
-def append_job(job, job_list, parallel):
-    p = subprocess.Popen(job)  # pylint: disable=consider-using-with
-    if not parallel:
-        try:
-            time.sleep(5)
-            p.wait()
-            check_job_returncode(p)
-        finally:
-            p.kill()
-    else:
-        job_list.append(p)
-
+@dataclass
+class Job:  # pylint: disable=too-many-instance-attributes
+    """
+    A model run of the ensemble, started with command in the directory cwd.
+    If the runscript of the job is given, a marker file next to it records the
+    outcome of the run.
+    """
 
-def finalize_jobs(job_list, dry, parallel):
-    if parallel and not dry:
-        last_exception = None
-        for job in job_list:
-            job.communicate()
+    name: str
+    command: List[str]
+    cwd: str
+    runscript: Optional[str] = None
+    process: Optional[subprocess.Popen] = field(default=None, repr=False)
+    start_time: Optional[float] = None
+    wall_time: Optional[float] = None
+    returncode: Optional[int] = None
+    runscript_hash: Optional[str] = None
+    skipped: bool = False
+
+
+def marker_file(job):
+    return f"{job.runscript}.status.json"
+
+
+def write_marker(job):
+    """Record the return code, wall time and runscript hash of a finished job."""
+    marker = {
+        "returncode": job.returncode,
+        "wall_time": job.wall_time,
+        "runscript_sha256": job.runscript_hash,
+        "command": job.command,
+    }
+    try:
+        with open(marker_file(job), "w", encoding="utf-8") as f:
+            json.dump(marker, f)
+    except OSError as e:
+        logger.warning("could not write marker file of %s: %s", job.name, e)
+
+
+def job_completed(job):
+    """
+    Check whether the marker file of the job records a successful run of the
+    current runscript.
+    """
+    if job.runscript is None:
+        return False
+    try:
+        with open(marker_file(job), "r", encoding="utf-8") as f:
+            marker = json.load(f)
+        return marker["returncode"] == 0 and marker[
+            "runscript_sha256"
+        ] == file_content_hash(job.runscript)
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+
+def start_job(job):
+    logger.info("running %s with '%s'", job.name, " ".join(job.command))
+    if job.runscript is not None:
+        # remove the marker of an earlier run, the run is not completed yet
+        if os.path.exists(marker_file(job)):
+            os.remove(marker_file(job))
+        job.runscript_hash = file_content_hash(job.runscript)
+    job.start_time = time.monotonic()
+    # pylint: disable-next=consider-using-with
+    job.process = subprocess.Popen(job.command, cwd=job.cwd)
+
+
+def finish_job(job):
+    job.wall_time = time.monotonic() - job.start_time
+    job.returncode = job.process.returncode
+    logger.info(
+        "%s finished after %.1f s with return code %d",
+        job.name,
+        job.wall_time,
+        job.returncode,
+    )
+    if job.runscript is not None:
+        write_marker(job)
+
+
+def cancel_jobs(jobs):
+    for job in jobs:
+        logger.info("cancelling %s", job.name)
+        job.process.terminate()
+    for job in jobs:
+        job.process.wait()
+        finish_job(job)
+
+
+def skip_completed_jobs(jobs, on_success):
+    """Return the jobs which have not been completed yet."""
+    pending = []
+    for job in jobs:
+        if job_completed(job):
+            logger.info("skipping %s, it has already finished successfully", job.name)
+            job.skipped = True
+            if on_success is not None:
+                on_success(job)
+        else:
+            pending.append(job)
+    return pending
+
+
+def run_jobs(  # pylint: disable=too-many-positional-arguments
+    jobs,
+    max_parallel=1,
+    on_failure="continue",
+    poll_interval=0.5,
+    on_success=None,
+    resume=False,
+):
+    """
+    Run the jobs with at most max_parallel of them at the same time, starting
+    the next job as soon as a running one has finished. Each job which
+    finishes with return code 0 is passed to on_success. If a job fails, the
+    remaining jobs are either still run (on_failure="continue") or the running
+    ones are terminated and the pending ones are not started
+    (on_failure="cancel"). Raises CalledProcessError for the last failed job
+    once no job is running anymore. With resume, jobs whose marker file records
+    a successful run of the unchanged runscript are skipped, but still passed
+    to on_success.
+    """
+    pending = skip_completed_jobs(jobs, on_success) if resume else list(jobs)
+    running = []
+    failure = None
+
+    while pending or running:
+        while pending and len(running) < max(max_parallel, 1):
+            job = pending.pop(0)
+            start_job(job)
+            running.append(job)
+
+        finished = [job for job in running if job.process.poll() is not None]
+        if not finished:
+            time.sleep(poll_interval)
+            continue
+
+        for job in finished:
+            running.remove(job)
+            finish_job(job)
             try:
-                check_job_returncode(job)
+                check_job_returncode(job.process)
             except subprocess.CalledProcessError as e:
                 logger.error(e)
-                last_exception = e
-        if last_exception:
-            raise last_exception
+                failure = e
+            else:
+                if on_success is not None:
+                    on_success(job)
+
+        if failure is not None and on_failure == "cancel":
+            cancel_jobs(running)
+            running = []
+            for job in pending:
+                logger.info("not starting %s", job.name)
+            pending = []
+
+    log_wall_times(jobs)
+
+    if failure is not None:
+        raise failure
+
+
+def compute_stats_file(input_dir, file_id, stats_file_name, file_specification):
+    """
+    Write the stats file of a model run in a pool worker. A sys.exit of
+    create_stats_dataframe is raised as RuntimeError instead, as it would end
+    the worker and leave its result pending forever.
+    """
+    try:
+        create_stats_dataframe(input_dir, file_id, stats_file_name, file_specification)
+    except SystemExit as e:
+        raise RuntimeError(
+            f"could not compute the stats file {stats_file_name} (exit code {e.code})"
+        ) from e
+
+
+def run_jobs_with_stats(  # pylint: disable=too-many-positional-arguments
+    jobs, stats_args, max_parallel, on_failure, resume=False
+):
+    """
+    Run the jobs like run_jobs and compute the stats of each job as soon as it
+    has finished successfully, in at most max_parallel worker processes (and
+    not more than there are CPUs) while the remaining jobs are still running.
+    stats_args maps the job names to the arguments of create_stats_dataframe.
+    The stats of skipped jobs are only computed if their stats file does not
+    exist yet. All stats are computed before a failed model run or stats
+    computation is raised.
+    """
+    processes = max(1, min(max_parallel, os.cpu_count() or 1))
+    with Pool(processes) as p:
+        results = {}
+
+        def compute_stats(job):
+            if job.skipped and os.path.exists(stats_args[job.name][2]):
+                return
+            logger.info("computing the stats of %s", job.name)
+            results[job.name] = p.apply_async(compute_stats_file, stats_args[job.name])
+
+        failure = None
+        try:
+            run_jobs(
+                jobs,
+                max_parallel,
+                on_failure,
+                on_success=compute_stats,
+                resume=resume,
+            )
+        except subprocess.CalledProcessError as e:
+            failure = e
+        finally:
+            p.close()
+            p.join()
+
+        for name, result in results.items():
+            try:
+                result.get()
+            # pylint: disable-next=broad-exception-caught
+            except Exception as e:
+                logger.error("stats of %s: %s", name, e)
+                failure = failure or e
+
+    if failure is not None:
+        raise failure
+
+
+def check_stats_options(**options):
+    """Raise a click.UsageError naming the first stats option which is not set."""
+    for name, value in options.items():
+        if not value:
+            raise click.UsageError(
+                f"--stats needs --{name.replace('_', '-')} to be set"
+            )
+
+
+def log_wall_times(jobs):
+    lines = [
+        f"{job.name}: {job.wall_time:.1f} s (return code {job.returncode})"
+        for job in jobs
+        if job.wall_time is not None
+    ]
+    if lines:
+        logger.info("wall times of the model runs:\n%s", "\n".join(lines))
 
 
 def check_job_returncode(job):
@@ -196,6 +419,53 @@ def check_job_returncode(job):
     is_flag=True,
     help=cli_help["parallel"],
 )
+@click.option(
+    "--max-parallel",
+    type=int,
+    default=None,
+    help=cli_help["max_parallel"],
+)
+@click.option(
+    "--on-failure",
+    type=click.Choice(["continue", "cancel"]),
+    default=None,
+    help=cli_help["on_failure"],
+)
+@click.option(
+    "--resume/--no-resume",
+    is_flag=True,
+    help=cli_help["resume"],
+)
+@click.option(
+    "--stats/--no-stats",
+    is_flag=True,
+    help=cli_help["run_stats"],
+)
+@click.option(
+    "--stats-file-name",
+    help=cli_help["stats_file_name"],
+)
+@click.option(
+    "--model-output-dir",
+    help=cli_help["model_output_dir"],
+)
+@click.option(
+    "--perturbed-model-output-dir",
+    help=cli_help["perturbed_model_output_dir"],
+)
+@click.option(
+    "--file-id",
+    nargs=2,
+    type=str,
+    multiple=True,
+    metavar="FILE_TYPE FILE_PATTERN",
+    help=cli_help["file_id"],
+)
+@click.option(
+    "--file-specification",
+    type=list,
+    help=cli_help["file_specification"],
+)
 @click.option(
     "--dry/--no-dry",
     is_flag=True,
@@ -227,38 +497,69 @@ def run_ensemble(
     member_ids,
     member_type,
     parallel,
+    max_parallel,
+    on_failure,
+    resume,
+    stats,
+    stats_file_name,
+    model_output_dir,
+    perturbed_model_output_dir,
+    file_id,
+    file_specification,
     dry,
     lhs,
     rhs_new,
     rhs_old,
 ):  # pylint: disable=too-many-positional-arguments
+    if stats:
+        check_stats_options(
+            stats_file_name=stats_file_name,
+            model_output_dir=model_output_dir,
+            perturbed_model_output_dir=perturbed_model_output_dir,
+            file_id=file_id,
+            file_specification=file_specification,
+        )
+
     perturbed_run_dir = perturbed_run_dir if perturbed_run_dir else run_dir
     os.chdir(run_dir)
-    job_list = []
-
-    # run the reference
-    if not dry:
-        logger.info("running unperturbed reference")
-        job = submit_command.split() + [run_script_name]
-        append_job(job, job_list, parallel)
+    # a relative perturbed_run_dir is relative to run_dir, both where the
+    # runscripts are written and where the members are started
+    perturbed_run_dir = os.path.abspath(perturbed_run_dir)
+
+    # the unperturbed reference runs first
+    jobs = [
+        Job(
+            "unperturbed reference",
+            submit_command.split() + [run_script_name],
+            os.path.abspath(run_dir),
+            os.path.join(os.path.abspath(run_dir), run_script_name),
+        )
+    ]
+    if stats:
+        # can't store dicts as defaults in click
+        file_specification = file_specification[0]
+        stats_args = {
+            jobs[0].name: (
+                model_output_dir,
+                file_id,
+                stats_file_name.format(member_id="ref"),
+                file_specification,
+            )
+        }
 
     # run the ensemble
     for member_id in member_ids:
 
-        Path(perturbed_run_dir.format(member_id=str(member_id))).mkdir(
-            exist_ok=True, parents=True
-        )
-        os.chdir(perturbed_run_dir.format(member_id=str(member_id)))
-
         runscript = f"{run_dir}/{run_script_name}"
 
         typed_member_id = prepend_type_to_member_id(member_type, member_id)
 
-        perturbed_run_dir_path = perturbed_run_dir.format(member_id=typed_member_id)
+        member_run_dir = perturbed_run_dir.format(member_id=typed_member_id)
+        Path(member_run_dir).mkdir(exist_ok=True, parents=True)
         perturbed_run_script_path = perturbed_run_script_name.format(
             member_id=typed_member_id
         )
-        perturbed_runscript = f"{perturbed_run_dir_path}/{perturbed_run_script_path}"
+        perturbed_runscript = f"{member_run_dir}/{perturbed_run_script_path}"
 
         prepare_perturbed_run_script(
             runscript,
@@ -271,11 +572,31 @@ def run_ensemble(
             get_seed_from_member_id(member_id),
         )
 
-        if not dry:
-            job = submit_command.split() + [perturbed_runscript]
-            logger.info("running the model with '%s'", " ".join(job))
-            append_job(job, job_list, parallel)
+        jobs.append(
+            Job(
+                f"member {typed_member_id}",
+                submit_command.split() + [perturbed_runscript],
+                member_run_dir,
+                perturbed_runscript,
+            )
+        )
+        if stats:
+            stats_args[jobs[-1].name] = (
+                perturbed_model_output_dir.format(member_id=typed_member_id),
+                file_id,
+                stats_file_name.format(member_id=typed_member_id),
+                file_specification,
+            )
 
-    finalize_jobs(job_list, dry, parallel)
+    if not dry:
+        if max_parallel is None:
+            max_parallel = len(jobs) if parallel else 1
+        if on_failure is None:
+            # serial runs stop at the first failure, as they always did
+            on_failure = "cancel" if max_parallel == 1 else "continue"
+        if stats:
+            run_jobs_with_stats(jobs, stats_args, max_parallel, on_failure, resume)
+        else:
+            run_jobs(jobs, max_parallel, on_failure, resume=resume)
 
     logger.info("model finished!")
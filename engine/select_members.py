@@ -7,7 +7,6 @@ It can find members and a corresponding tolerance factor that validate for all
 stats files or test the tolerance of a given selection.
 """
 
-import logging
 import os
 import sys
 from datetime import datetime
@@ -16,9 +15,13 @@ import click
 
 from engine.tolerance import tolerance
 from util.click_util import CommaSeparatedStrings, cli_help
-from util.dataframe_ops import check_file_with_tolerances
+from util.dataframe_ops import check_stats_files_with_tolerances
 from util.log_handler import logger
-from util.utils import FileInfo, validate_single_stats_file
+from util.utils import (
+    FileInfo,
+    prepend_type_to_member_id,
+    validate_single_stats_file,
+)
 
 
 def find_members_and_factor_validating_for_all_stats_files(
@@ -149,36 +152,32 @@ def check_selection_by_ids(
     Returns the number of passed stats files and the variables which failed
     """
 
-    passed = set()
-    failed = set()
+    member_ids = list(member_ids)
+    stats_files = [
+        FileInfo(
+            stats_file_name.format(
+                member_id=prepend_type_to_member_id(member_type, mem)
+            )
+        )
+        for mem in member_ids
+    ]
+
+    passed_files, failed_variables = check_stats_files_with_tolerances(
+        tolerance_file_name,
+        FileInfo(stats_file_name.format(member_id="ref")),
+        stats_files,
+        factor,
+    )
 
-    # Change level to not get whole output from check_file_with_tolerances
-    original_level = logging.getLogger().level
-    logging.getLogger().setLevel(logging.ERROR)
+    passed = {mem for mem, out in zip(member_ids, passed_files) if out}
+    failed = {mem for mem, out in zip(member_ids, passed_files) if not out}
 
     variables = set()
-
-    for mem in member_ids:
-        m_id = str(mem) if not member_type else member_type + "_" + str(mem)
-
-        out, err, _ = check_file_with_tolerances(
-            tolerance_file_name,
-            FileInfo(stats_file_name.format(member_id="ref")),
-            FileInfo(stats_file_name.format(member_id=m_id)),
-            factor,
-        )
-
-        if out:
-            passed.add(mem)
-        else:
-            failed.add(mem)
-            var = set(index[1] for index in err[0].index)
-            variables.update(var)
+    for var in failed_variables:
+        variables.update(var)
 
     variables = list(variables)
 
-    # Reset logger level
-    logging.getLogger().setLevel(original_level)
     logger.info(
         "... %s member(s) out of %s pass.\n",
         len(passed),
@@ -21,13 +21,17 @@ from util.utils import prepend_type_to_member_id
 def create_stats_dataframe(input_dir, file_id, stats_file_name, file_specification):
     df = df_from_file_ids(file_id, input_dir, file_specification)
 
+    write_stats_file(df, stats_file_name)
+
+    return df
+
+
+def write_stats_file(df, stats_file_name):
     logger.info("writing stats file to %s", stats_file_name)
 
     Path(stats_file_name).parent.mkdir(parents=True, exist_ok=True)
     df.to_csv(stats_file_name)
 
-    return df
-
 
 @click.command()
 @click.option(
@@ -15,9 +15,12 @@ from util.click_util import CommaSeparatedInts, CommaSeparatedStrings, cli_help
 from util.dataframe_ops import (
     compute_rel_diff_dataframe,
     file_name_parser,
+    fof_tolerance,
     force_monotonic,
     has_enough_data,
+    parse_probtest_fof_observations,
 )
+from util.fof_utils import group_fof_tolerance
 from util.log_handler import logger
 from util.utils import FileInfo, FileType, expand_fof, expand_members
 
@@ -59,6 +62,12 @@ from util.utils import FileInfo, FileType, expand_fof, expand_members
     default="0.0",
     help=cli_help["minimum_tolerance"],
 )
+@click.option(
+    "--fof-group-by",
+    type=CommaSeparatedStrings(),
+    default="",
+    help=cli_help["fof_group_by"],
+)
 def tolerance(
     ensemble_files,
     tolerance_files,
@@ -66,6 +75,7 @@ def tolerance(
     member_type,
     fof_types,
     minimum_tolerance,
+    fof_group_by,
 ):  # pylint: disable=too-many-positional-arguments
 
     files_list = zip(ensemble_files, tolerance_files)
@@ -76,42 +86,41 @@ def tolerance(
         ensemble_files = expand_members(
             mem, member_ids=member_ids, member_type=member_type
         )
-        dfs = [
-            file_name_parser[info.file_type](info.path)
-            for file in ensemble_files
-            for info in [FileInfo(file)]
-        ]
-
         ref_info = FileInfo(mem.format(member_id="ref", member_type=""))
+
         if ref_info.file_type is FileType.FOF:
             ref_info.path = ref_info.path.replace("ref", "")
-        df_ref = file_name_parser[ref_info.file_type](ref_info.path)
-
-        has_enough_data(dfs)
-        df_ref = df_ref["veri_data"] if ref_info.file_type is FileType.FOF else df_ref
-        dfs = (
-            [df["veri_data"] for df in dfs]
-            if ref_info.file_type is FileType.FOF
-            else dfs
-        )
+            has_enough_data(ensemble_files)
+            df_ref = parse_probtest_fof_observations(
+                ref_info.path, ("veri_data", *fof_group_by)
+            )
+            # the members are read one at a time
+            dfs = (
+                file_name_parser[FileInfo(file).file_type](file)["veri_data"]
+                for file in ensemble_files
+            )
+            df_max = fof_tolerance(df_ref["veri_data"], dfs, minimum_tolerance)
+            if fof_group_by:
+                df_max = group_fof_tolerance(df_max, df_ref[list(fof_group_by)])
+
+        else:
+            dfs = [
+                file_name_parser[info.file_type](info.path)
+                for file in ensemble_files
+                for info in [FileInfo(file)]
+            ]
+            df_ref = file_name_parser[ref_info.file_type](ref_info.path)
+
+            has_enough_data(dfs)
 
-        rdiff = [compute_rel_diff_dataframe(df_ref, df) for df in dfs]
+            rdiff = [compute_rel_diff_dataframe(df_ref, df) for df in dfs]
 
-        if ref_info.file_type is FileType.STATS:
             rdiff_max = [r.groupby(["file_ID", "variable"]).max() for r in rdiff]
             df_max = pd.concat(rdiff_max).groupby(["file_ID", "variable"]).max()
-            df_max = df_max.map(
-                lambda x: minimum_tolerance if x < minimum_tolerance else x
-            )
+            df_max = df_max.mask(df_max < minimum_tolerance, minimum_tolerance)
 
             force_monotonic(df_max)
 
-        elif ref_info.file_type is FileType.FOF:
-            df_max = pd.concat(rdiff, axis=1).max(axis=1)
-            df_max = df_max.map(
-                lambda x: minimum_tolerance if x < minimum_tolerance else x
-            )
-
         tolerance_dir = os.path.dirname(tol)
 
         if tolerance_dir and not os.path.exists(tol):
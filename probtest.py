@@ -12,6 +12,7 @@ import matplotlib
 
 from engine.cdo_table import cdo_table
 from engine.check import check
+from engine.check_output import check_output
 from engine.fof_compare import fof_compare
 from engine.init import init
 from engine.performance import performance
@@ -58,6 +59,7 @@ cli.add_command(init)
 cli.add_command(perturb)
 cli.add_command(stats)
 cli.add_command(check)
+cli.add_command(check_output)
 cli.add_command(tolerance)
 cli.add_command(select_members)
 cli.add_command(run_ensemble)
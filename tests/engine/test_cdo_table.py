@@ -0,0 +1,51 @@
+"""
+This module contains unit tests for the rel-diff and histogram computation of
+the `engine.cdo_table` module.
+"""
+
+import numpy as np
+import xarray as xr
+
+from engine.cdo_table import compute_rel_diff, histograms, rel_diff_variable
+from util.constants import cdo_bins
+
+
+def test_histograms_equal_np_histogram():
+    bins = np.array([0] + cdo_bins)
+    rng = np.random.default_rng(0)
+    data = 10.0 ** rng.uniform(-16, 1, size=(4, 100))
+    data[0, :3] = [0, 1, -1]
+    data[1, :2] = np.nan
+    valid = np.ones_like(data, dtype=bool)
+    valid[2, :10] = False
+
+    hist = histograms(data, bins, valid)
+
+    for row, row_valid, row_hist in zip(data, valid, hist):
+        expected, _ = np.histogram(row[row_valid], bins=bins)
+        np.testing.assert_array_equal(row_hist, expected)
+
+
+def test_rel_diff_variable():
+    ref = xr.Dataset(
+        {
+            "T": (("time", "ncells"), np.array([[1, 2], [0, 4]], dtype=np.float32)),
+            "area": (("ncells",), np.array([3.0, 5.0])),
+        }
+    )
+    ref["T"].encoding["_FillValue"] = -1.0
+    perturbed = ref.copy(deep=True)
+    perturbed["T"][:] = [[1.5, 2], [1, 4]]
+
+    diff = rel_diff_variable(ref, perturbed, "T")
+
+    assert diff.dtype == np.float64
+    assert diff.attrs["_FillValue"] == -1.0
+    np.testing.assert_array_equal(
+        diff.values, compute_rel_diff(ref["T"].values, perturbed["T"].values)
+    )
+    np.testing.assert_array_equal(diff.values, [[0.5, 0], [999, 0]])
+    # variables without time dimension keep their values
+    np.testing.assert_array_equal(
+        rel_diff_variable(ref, perturbed, "area").values, [3.0, 5.0]
+    )
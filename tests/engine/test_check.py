@@ -3,7 +3,9 @@ This module contains test cases to validate the functionality
 of check CLI commands.
 """
 
+import logging
 import os
+from unittest.mock import patch
 
 import numpy as np
 import pandas as pd
@@ -11,6 +13,12 @@ import pytest
 from click.testing import CliRunner
 
 from engine.check import check
+from tests.helpers import nan_check_dataframes
+from util.dataframe_ops import (
+    check_file_with_tolerances,
+    enable_persistent_parse_cache,
+)
+from util.utils import FileInfo
 
 
 @pytest.fixture(name="fof_datasets", scope="function")
@@ -180,3 +188,154 @@ def test_check_cli_fof(fof_datasets):
     )
 
     assert result.exit_code == 0
+
+
+def test_check_cli_stats_jobs(stats_dataframes, caplog):
+    """
+    Checking several files with a worker pool reports the results in the order
+    of the input.
+    """
+
+    df1_stats, df2_stats, _, tol_small = stats_dataframes
+
+    runner = CliRunner()
+    with caplog.at_level(logging.INFO):
+        result = runner.invoke(
+            check,
+            [
+                "--reference-files",
+                f"{df1_stats},{df1_stats}",
+                "--current-files",
+                f"{df1_stats},{df2_stats}",
+                "--tolerance-files",
+                f"{tol_small},{tol_small}",
+                "--factor",
+                "1.0",
+                "--fof-types",
+                "",
+                "--jobs",
+                "2",
+            ],
+        )
+
+    assert result.exit_code == 1
+    results = [r.message for r in caplog.records if "RESULT" in r.message]
+    assert results == [
+        f"RESULT: check PASSED for {df1_stats}",
+        f"RESULT: check FAILED for {df2_stats}",
+    ]
+
+
+def test_check_cli_stats_cache_dir(stats_dataframes, tmp_path):
+    """
+    With a cache directory the parsed reference and tolerance files are stored
+    there and reused by the next invocation.
+    """
+
+    df1_stats, df2_stats, tol_large, _ = stats_dataframes
+    cache_dir = tmp_path / "cache"
+    args = [
+        "--reference-files",
+        df1_stats,
+        "--current-files",
+        df2_stats,
+        "--tolerance-files",
+        tol_large,
+        "--factor",
+        "1.0",
+        "--fof-types",
+        "",
+        "--cache-dir",
+        str(cache_dir),
+    ]
+
+    for _ in range(2):
+        result = CliRunner().invoke(check, args)
+        assert result.exit_code == 0
+
+    assert len(list(cache_dir.glob("*.pkl"))) == 2
+
+    enable_persistent_parse_cache(None)
+
+
+def test_check_cli_stats_fail_fast(stats_dataframes, caplog):
+    """
+    With --fail-fast the files after the first failing one are not checked and
+    with --summary-only the differences are not printed.
+    """
+
+    df1_stats, df2_stats, _, tol_small = stats_dataframes
+
+    with caplog.at_level(logging.INFO):
+        result = CliRunner().invoke(
+            check,
+            [
+                "--reference-files",
+                f"{df1_stats},{df1_stats}",
+                "--current-files",
+                f"{df2_stats},{df1_stats}",
+                "--tolerance-files",
+                f"{tol_small},{tol_small}",
+                "--factor",
+                "1.0",
+                "--fof-types",
+                "",
+                "--fail-fast",
+                "--summary-only",
+            ],
+        )
+
+    assert result.exit_code == 1
+    results = [r.message for r in caplog.records if "RESULT" in r.message]
+    assert results == [f"RESULT: check FAILED for {df2_stats}"]
+    assert "Differences" not in caplog.text
+
+
+@pytest.mark.parametrize(
+    "ref_val, cur_val, expected_pass",
+    [(np.nan, 1.0, False), (np.nan, np.nan, True), (1.0, 1.0, True)],
+)
+@pytest.mark.parametrize(
+    "fail_fast, summary_only", [(True, False), (False, True), (True, True)]
+)
+@patch("util.dataframe_ops.parse_check")
+def test_check_file_fast_modes(
+    mock_parse_check, ref_val, cur_val, expected_pass, fail_fast, summary_only
+):  # pylint: disable=too-many-positional-arguments
+    """
+    The fail-fast and summary-only modes give the same result as the full check.
+    """
+    mock_parse_check.return_value = nan_check_dataframes(ref_val, cur_val)
+
+    out, err, _ = check_file_with_tolerances(
+        "tol.csv",
+        FileInfo("ref.csv"),
+        FileInfo("cur.csv"),
+        1.0,
+        fail_fast=fail_fast,
+        summary_only=summary_only,
+    )
+
+    assert out is expected_pass
+    if summary_only or expected_pass:
+        assert err.empty
+    else:
+        assert list(err.index) == [("f", "var_1")]
+
+
+@patch("util.dataframe_ops.parse_check")
+def test_check_file_identical(mock_parse_check, fof_datasets, tmp_dir):
+    """
+    Bit-identical files pass without being parsed.
+    """
+    ds1_file, _, tol_file, _ = fof_datasets
+    copy_file = os.path.join(tmp_dir, "fof1_copy.nc")
+    with open(ds1_file, "rb") as src, open(copy_file, "wb") as dst:
+        dst.write(src.read())
+
+    out, err, tol = check_file_with_tolerances(
+        tol_file, FileInfo(ds1_file), FileInfo(copy_file), 1.0
+    )
+
+    assert out is True and err.empty and tol.empty
+    mock_parse_check.assert_not_called()
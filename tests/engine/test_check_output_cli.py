@@ -0,0 +1,88 @@
+"""
+This module contains test cases for verifying the functionality of the
+`check-output` command-line interface (CLI).
+"""
+
+import os
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from engine.check_output import check_output
+from tests.helpers import (
+    NETCDF_FILE_ARGS,
+    assert_empty_df,
+    load_pandas,
+    pandas_error,
+)
+
+
+def run_check_output_cli(model_output_dir, reference_file, tolerance_file, args):
+    return CliRunner().invoke(
+        check_output,
+        [
+            "--model-output-dir",
+            model_output_dir,
+            "--reference-files",
+            reference_file,
+            "--tolerance-files",
+            tolerance_file,
+            "--factor",
+            "5",
+        ]
+        + NETCDF_FILE_ARGS
+        + args,
+    )
+
+
+@pytest.fixture(name="tolerance_file")
+def fixture_tolerance_file(df_ref_stats, tmp_path):
+    tolerance_file = tmp_path / "tolerance.csv"
+    tol = df_ref_stats.groupby(["file_ID", "variable"]).max() * 0.0 + 1e-3
+    tol.to_csv(tolerance_file)
+    return str(tolerance_file)
+
+
+def test_check_output_cli(nc_with_t_u_v, ref_data, df_ref_stats, tolerance_file):
+    """
+    The model output is checked against the reference without an intermediate
+    stats file; the stats file written for archiving matches the reference and
+    is named after the model output directory.
+    """
+    model_output_dir = os.path.dirname(nc_with_t_u_v)
+    member_id = os.path.basename(model_output_dir)
+    stats_file = os.path.join(model_output_dir, "archive", f"stats_{member_id}.csv")
+
+    result = run_check_output_cli(
+        model_output_dir + "/",
+        os.path.join(ref_data, "ref_stats.csv"),
+        tolerance_file,
+        [
+            "--stats-file-name",
+            os.path.join(model_output_dir, "archive", "stats_{member_id}.csv"),
+        ],
+    )
+
+    assert result.exit_code == 0
+    err = pandas_error(df_ref_stats, load_pandas(stats_file))
+    assert_empty_df(err, "Stats datasets are not equal!")
+
+
+def test_check_output_cli_fails(nc_with_t_u_v, df_ref_stats, tolerance_file, tmp_path):
+    """
+    A reference which differs from the model output makes the check fail.
+    """
+    df_ref = df_ref_stats.copy()
+    df_ref.loc[pd.IndexSlice[:, "U", :], :] *= 1.1
+    reference_file = tmp_path / "ref_stats.csv"
+    df_ref.to_csv(reference_file)
+
+    result = run_check_output_cli(
+        os.path.dirname(nc_with_t_u_v),
+        str(reference_file),
+        tolerance_file,
+        ["--fail-fast"],
+    )
+
+    assert result.exit_code == 1
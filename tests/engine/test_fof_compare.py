@@ -5,12 +5,22 @@ of fof-compare CLI commands.
 
 import logging
 import os
+import shutil
 from pathlib import Path
 
+import pandas as pd
 import pytest
 from click.testing import CliRunner
 
 from engine.fof_compare import fof_compare
+from util.checksum import identical_variables
+from util.dataframe_ops import (
+    check_fof_datasets_with_tolerances,
+    check_fof_with_tolerances,
+    fof_dataframes,
+    fof_tolerance_dataframe,
+)
+from util.fof_utils import COMPARE_CHUNK_SIZE
 
 
 @pytest.fixture(name="fof_datasets", scope="function")
@@ -166,3 +176,144 @@ def test_fof_compare_consistent(fof_datasets, tmp_dir, monkeypatch, caplog):
         )
 
     assert "Files are consistent!" in caplog.text
+
+
+@pytest.mark.parametrize(
+    "tolerance, expected",
+    [(1.0, True), (0.0, False), ({3: 1.0, 4: 1.0}, True), ({3: 1.0}, False)],
+)
+def test_check_fof_datasets_with_tolerances(
+    fof_datasets_base, tmp_dir, tolerance, expected
+):
+    """
+    Test the in-memory check of opened datasets with a scalar tolerance and a
+    tolerance per varno; varnos without tolerance must be equal.
+    """
+    ds1, ds2, _, _ = fof_datasets_base
+
+    out, err, _ = check_fof_datasets_with_tolerances(
+        ds1, ds2, tolerance, os.path.join(tmp_dir, "error_fof1_SYNOP.log")
+    )
+
+    assert out is expected
+    if tolerance == {3: 1.0}:
+        assert len(err) == 4
+
+
+@pytest.mark.parametrize(
+    "variable, rules",
+    [("veri_data", {}), ("flags", {}), ("flags", {"flags": [9, 18]}), ("obs", {})],
+)
+@pytest.mark.parametrize("chunk_size", [2, COMPARE_CHUNK_SIZE])
+def test_check_fof_datasets_block_wise(
+    fof_datasets_base, tmp_dir, variable, rules, chunk_size
+):
+    """
+    The datasets compared block by block in sorted order, with or without
+    the identical variables, give the same result and log file as their
+    DataFrames compared by check_fof_with_tolerances.
+    """
+    ds1, _, _, _ = fof_datasets_base
+    ds2 = ds1.assign({variable: ds1[variable] * 2})
+    log_files = [os.path.join(tmp_dir, f"error_fof{i}_SYNOP.log") for i in range(3)]
+
+    df1_rep, df1_obs = fof_dataframes(ds1)
+    df2_rep, df2_obs = fof_dataframes(ds2)
+    expected = check_fof_with_tolerances(
+        fof_tolerance_dataframe(1.0, df1_obs),
+        {"reports": df1_rep, "observation": df1_obs},
+        {"reports": df2_rep, "observation": df2_obs},
+        rules,
+        log_files[0],
+    )
+    results = [
+        check_fof_datasets_with_tolerances(
+            ds1,
+            ds2,
+            1.0,
+            log_file,
+            rules=rules,
+            identical_variables=identical,
+            chunk_size=chunk_size,
+        )
+        for log_file, identical in zip(
+            log_files[1:], [frozenset(), identical_variables(ds1, ds2)]
+        )
+    ]
+
+    logs = [
+        Path(f).read_text(encoding="utf-8").replace(f, "") if Path(f).exists() else ""
+        for f in log_files
+    ]
+    for (out, err, tol), log in zip(results, logs[1:]):
+        assert out == expected[0]
+        pd.testing.assert_frame_equal(err, expected[1])
+        pd.testing.assert_frame_equal(tol, expected[2])
+        assert log.split("\n")[1:] == logs[0].split("\n")[1:]
+
+
+def test_fof_compare_jobs(fof_datasets, tmp_dir, monkeypatch, caplog):
+    """
+    Test that fof types compared in parallel are reported in the order of the
+    input, each with its own detailed log file.
+    """
+    df1, df2, df3 = fof_datasets
+    shutil.copy(df1, df1.replace("SYNOP", "TEMP"))
+    shutil.copy(df3, df2.replace("SYNOP", "TEMP"))
+    monkeypatch.chdir(tmp_dir)
+
+    runner = CliRunner()
+    with caplog.at_level(logging.INFO):
+        result = runner.invoke(
+            fof_compare,
+            [
+                "--file1",
+                df1.replace("SYNOP", "{fof_type}"),
+                "--file2",
+                df2.replace("SYNOP", "{fof_type}"),
+                "--fof-types",
+                "SYNOP,TEMP",
+                "--tolerance",
+                "5",
+                "--jobs",
+                "2",
+            ],
+        )
+
+    assert result.exit_code == 0
+    results = [
+        m for m in caplog.messages if m.startswith(("Files are", "Complete output"))
+    ]
+    assert results == [
+        "Files are consistent!",
+        "Files are NOT consistent!",
+        "Complete output available in error_fof1_TEMP.log",
+    ]
+    assert not Path(tmp_dir, "error_fof1_SYNOP.log").exists()
+    assert "flags" in Path(tmp_dir, "error_fof1_TEMP.log").read_text(encoding="utf-8")
+
+
+def test_fof_compare_identical(fof_datasets, tmp_dir, monkeypatch, caplog):
+    """
+    Test that bit-identical files are not compared in full.
+    """
+    df1, _, _ = fof_datasets
+    shutil.copy(df1, df1.replace("fof1", "fof4"))
+    monkeypatch.chdir(tmp_dir)
+
+    runner = CliRunner()
+    with caplog.at_level(logging.INFO):
+        runner.invoke(
+            fof_compare,
+            [
+                "--file1",
+                df1.replace("SYNOP", "{fof_type}"),
+                "--file2",
+                df1.replace("fof1", "fof4").replace("SYNOP", "{fof_type}"),
+                "--fof-types",
+                "SYNOP",
+            ],
+        )
+
+    assert "Files are identical, skipping the comparison" in caplog.text
+    assert "Files are consistent!" in caplog.text
@@ -10,7 +10,11 @@ import pytest
 from matplotlib import pyplot as plt
 from netCDF4 import Dataset  # pylint: disable=no-name-in-module
 
-from engine.perturb import perturb_array
+from engine.perturb import (
+    perturb_array,
+    perturb_array_inplace,
+    perturbation_pattern_philox,
+)
 
 atype = np.float32
 AMPLITUDE = atype(1e-14)
@@ -51,6 +55,63 @@ def test_perturb_array():
     ), "perturbation did not return a copy of input!"
 
 
+def test_perturb_array_inplace():
+    # in place, the perturbation is rounded to the dtype of the array
+    x = np.ones((ARRAY_DIM, ARRAY_DIM), dtype=np.float64)
+    x_perturbed = perturb_array_inplace(x, 10, AMPLITUDE)
+
+    assert x_perturbed is x, "perturbation was not applied in place!"
+    diff = np.abs(1 - x)
+    assert np.max(diff) < AMPLITUDE, "perturbation is larger than amplitude!"
+    assert np.isclose(
+        np.mean(diff), AMPLITUDE * 0.5, atol=AMPLITUDE * 1e-2
+    ), "perturbation is most likely too small!"
+
+
+@pytest.mark.parametrize("block_size", [1, 7, ARRAY_DIM, ARRAY_DIM**2 + 1])
+def test_perturb_array_inplace_block_size(block_size):
+    x_ref = perturb_array_inplace(np.ones((ARRAY_DIM, ARRAY_DIM)), 10, 1e-3)
+    x = perturb_array_inplace(
+        np.ones((ARRAY_DIM, ARRAY_DIM)), 10, 1e-3, block_size=block_size
+    )
+
+    np.testing.assert_array_equal(x, x_ref)
+
+
+@pytest.mark.parametrize("block_size", [7, ARRAY_DIM**2])
+def test_perturb_array_inplace_fill_value(tmp_path, block_size):
+    """
+    Like perturb_array, the in-place perturbation keeps the fill values of
+    masked cells, so that they are still missing once written back to a file.
+    """
+    with Dataset(tmp_path / "fill.nc", "w") as d:
+        d.createDimension("x", size=ARRAY_DIM)
+        d.createDimension("y", size=ARRAY_DIM)
+        z = d.createVariable("z", np.float64, ("x", "y"), fill_value=-999.0)
+        values = np.ones((ARRAY_DIM, ARRAY_DIM))
+        values[::3, ::5] = -999.0
+        z[:] = values
+
+    with Dataset(tmp_path / "fill.nc", "a") as d:
+        z_legacy = perturb_array(d.variables["z"][:], 10, 1e-3)
+        z_inplace = perturb_array_inplace(
+            d.variables["z"][:], 10, 1e-3, block_size=block_size
+        )
+        d.variables["z"][:] = z_inplace
+
+    with Dataset(tmp_path / "fill.nc", "r") as d:
+        z_file = d.variables["z"][:]
+
+    fill = values == -999.0
+    np.testing.assert_array_equal(z_legacy[fill], -999.0)
+    np.testing.assert_array_equal(z_inplace[fill], -999.0)
+    np.testing.assert_array_equal(np.ma.getmaskarray(z_file), fill)
+    np.testing.assert_array_equal(
+        z_inplace[~fill],
+        perturbation_pattern_philox(values.shape, 10, 1e-3)[~fill],
+    )
+
+
 def test_perturb_nc(tmp_dir, create_nc_files):
 
     data = create_nc_files
@@ -2,6 +2,7 @@
 This module contains tests for verifying the functionality of perturbing NetCDF files.
 """
 
+import filecmp
 import os
 
 import pytest
@@ -68,3 +69,50 @@ def test_perturb_cli_amplitude_0_2(nc_with_t_u_v, ds_ref_with_t_u_v):
     assert_empty_list(
         diff_keys, "The following variables are not contained in both files"
     )
+
+
+def test_perturb_cli_jobs(nc_with_t_u_v):
+    initial_condition = os.path.basename(nc_with_t_u_v)
+    tmp_path = os.path.dirname(nc_with_t_u_v)
+    member_ids = [1, 2, 3]
+
+    run_perturb_cli(
+        tmp_path, initial_condition, member_ids=member_ids, perturb_amplitude=0.2
+    )
+    serial = {}
+    for member_id in member_ids:
+        path = os.path.join(tmp_path, f"experiments/dp_{member_id}", initial_condition)
+        serial[member_id] = f"{path}.serial"
+        os.rename(path, serial[member_id])
+
+    run_perturb_cli(
+        tmp_path,
+        initial_condition,
+        member_ids=member_ids,
+        perturb_amplitude=0.2,
+        jobs=2,
+    )
+
+    for member_id in member_ids:
+        path = os.path.join(tmp_path, f"experiments/dp_{member_id}", initial_condition)
+        assert filecmp.cmp(path, serial[member_id], shallow=False)
+
+
+def test_perturb_cli_pattern_store(nc_with_t_u_v):
+    initial_condition = os.path.basename(nc_with_t_u_v)
+    tmp_path = os.path.dirname(nc_with_t_u_v)
+    path = os.path.join(tmp_path, "experiments/dp_1", initial_condition)
+
+    run_perturb_cli(tmp_path, initial_condition, member_ids=[1], perturb_amplitude=0.2)
+    os.rename(path, f"{path}.ref")
+
+    # generate and store the patterns, then reuse them
+    for _ in range(2):
+        run_perturb_cli(
+            tmp_path,
+            initial_condition,
+            member_ids=[1],
+            perturb_amplitude=0.2,
+            pattern_store=os.path.join(tmp_path, "patterns"),
+        )
+        assert filecmp.cmp(path, f"{path}.ref", shallow=False)
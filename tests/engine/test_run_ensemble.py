@@ -1,46 +1,223 @@
 """
 This module contains unit tests for the `engine.run_ensemble` module functions,
-specifically `append_job` and `finalize_jobs`.
+specifically `run_jobs`, `run_jobs_with_stats`, `run_ensemble` and
+`prepare_perturbed_run_script`.
 It uses the `unittest` framework to ensure the correctness of these functions
 under different scenarios.
 """
 
+import os
 import subprocess
 from pathlib import Path
 
 import pytest
+from click.testing import CliRunner
 
-from engine.run_ensemble import append_job, finalize_jobs, prepare_perturbed_run_script
+from engine.run_ensemble import (
+    Job,
+    prepare_perturbed_run_script,
+    run_ensemble,
+    run_jobs,
+    run_jobs_with_stats,
+)
 
 
-def test_job_successful_serial():
-    job = "test 1 = 1".split()
-    append_job(job=job, job_list=[], parallel=False)
+def make_jobs(commands, tmp_path):
+    return [
+        Job(f"member {i}", command.split(), str(tmp_path))
+        for i, command in enumerate(commands)
+    ]
 
 
-def test_job_successful_parallel():
-    job = "test 1 = 1".split()
-    job_list = []
+@pytest.mark.parametrize("max_parallel", [1, 2])
+def test_jobs_successful(tmp_path, max_parallel):
+    jobs = make_jobs(["test 1 = 1", "test 2 = 2", "test 3 = 3"], tmp_path)
 
-    append_job(job=job, job_list=job_list, parallel=True)
-    finalize_jobs(job_list=job_list, dry=False, parallel=True)
+    run_jobs(jobs, max_parallel=max_parallel, poll_interval=0.01)
 
+    assert [job.returncode for job in jobs] == [0, 0, 0]
+    assert all(job.wall_time >= 0 for job in jobs)
 
-def test_job_failed_serial():
-    job = "test 1 = 2".split()
 
+@pytest.mark.parametrize("max_parallel", [1, 2])
+def test_jobs_failed_continue(tmp_path, max_parallel):
+    jobs = make_jobs(["test 1 = 2", "test 2 = 2", "test 3 = 3"], tmp_path)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        run_jobs(jobs, max_parallel=max_parallel, poll_interval=0.01)
+
+    assert [job.returncode for job in jobs] == [1, 0, 0]
+
+
+def test_jobs_failed_cancel(tmp_path):
+    jobs = make_jobs(["test 1 = 2", "sleep 10", "test 3 = 3"], tmp_path)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        run_jobs(jobs, max_parallel=2, on_failure="cancel", poll_interval=0.01)
+
+    assert jobs[0].returncode == 1
+    # the running job is terminated, the pending one is never started
+    assert jobs[1].returncode != 0 and jobs[1].wall_time < 10
+    assert jobs[2].process is None
+
+
+def test_jobs_max_parallel(tmp_path):
+    jobs = make_jobs(["sleep 0.3"] * 4, tmp_path)
+
+    run_jobs(jobs, max_parallel=2, poll_interval=0.01)
+
+    # the third job starts once one of the first two has finished
+    assert jobs[2].start_time >= min(job.start_time + job.wall_time for job in jobs[:2])
+
+
+def make_stats_args(jobs, input_dirs, tmp_path):
+    file_specification = {
+        "NetCDF": {
+            "format": "netcdf",
+            "time_dim": "time",
+            "horizontal_dims": ["lat", "lon"],
+        }
+    }
+    return {
+        job.name: (
+            input_dir,
+            (("NetCDF", "*.nc"),),
+            str(tmp_path / f"stats_{i}.csv"),
+            file_specification,
+        )
+        for i, (job, input_dir) in enumerate(zip(jobs, input_dirs))
+    }
+
+
+def test_jobs_with_stats(tmp_path, nc_with_t_u_v):
+    jobs = make_jobs(["test 1 = 1", "test 2 = 3"], tmp_path)
+    stats_args = make_stats_args(jobs, [os.path.dirname(nc_with_t_u_v)] * 2, tmp_path)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        run_jobs_with_stats(jobs, stats_args, 2, "continue")
+
+    # only the successful run is reduced to stats
+    assert (tmp_path / "stats_0.csv").exists()
+    assert not (tmp_path / "stats_1.csv").exists()
+
+
+def test_jobs_with_stats_failed(tmp_path, nc_with_t_u_v, caplog):
+    jobs = make_jobs(["test 1 = 1", "test 2 = 3", "test 3 = 3"], tmp_path)
+    input_dirs = [str(tmp_path / "missing")] + [os.path.dirname(nc_with_t_u_v)] * 2
+    stats_args = make_stats_args(jobs, input_dirs, tmp_path)
+
+    # the failed model run is raised once all stats have been computed
     with pytest.raises(subprocess.CalledProcessError):
-        append_job(job=job, job_list=[], parallel=False)
+        run_jobs_with_stats(jobs, stats_args, 1, "continue")
+
+    assert "stats of member 0" in caplog.text
+    assert (tmp_path / "stats_2.csv").exists()
 
+    # without a failed model run, the failed stats computation is raised
+    with pytest.raises(RuntimeError, match="stats_0.csv"):
+        run_jobs_with_stats(jobs[:1], stats_args, 1, "continue")
 
-def test_job_failed_parallel():
-    job = "test 1 = 2".split()
-    job_list = []
 
-    append_job(job=job, job_list=job_list, parallel=True)
+def test_jobs_resume(tmp_path):
+    runscripts = [tmp_path / f"exp_{i}.run" for i in range(3)]
+    for i, runscript in enumerate(runscripts):
+        runscript.write_text(f"echo {i} >> runs.log\nexit {i % 2}\n")
+    jobs = [
+        Job(f"member {i}", ["bash", str(runscript)], str(tmp_path), str(runscript))
+        for i, runscript in enumerate(runscripts)
+    ]
 
     with pytest.raises(subprocess.CalledProcessError):
-        finalize_jobs(job_list=job_list, dry=False, parallel=True)
+        run_jobs(jobs, poll_interval=0.01)
+    runscripts[2].write_text("echo 2 changed >> runs.log\n")
+    jobs = [Job(job.name, job.command, job.cwd, job.runscript) for job in jobs]
+    with pytest.raises(subprocess.CalledProcessError):
+        run_jobs(jobs, poll_interval=0.01, resume=True)
+
+    # the successful run with an unchanged runscript is not repeated
+    assert (tmp_path / "runs.log").read_text().split("\n") == [
+        "0",
+        "1",
+        "2",
+        "1",
+        "2 changed",
+        "",
+    ]
+    assert [job.skipped for job in jobs] == [True, False, False]
+
+
+def invoke_run_ensemble(run_dir, *args):
+    return CliRunner().invoke(
+        run_ensemble,
+        [
+            "--run-dir",
+            str(run_dir),
+            "--perturbed-run-dir",
+            "ens/{member_id}",
+            "--run-script-name",
+            "exp.run",
+            "--perturbed-run-script-name",
+            "exp_{member_id}.run",
+            "--experiment-name",
+            "exp",
+            "--perturbed-experiment-name",
+            "exp_{member_id}",
+            "--submit-command",
+            "bash",
+            "--member-ids",
+            "1,2",
+            "--lhs",
+            "seed",
+            "--rhs-new",
+            "{seed}",
+            *args,
+        ],
+    )
+
+
+def test_run_ensemble_relative_perturbed_run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "exp.run").write_text("seed=0\npwd > cwd.txt\n")
+
+    result = invoke_run_ensemble(tmp_path, "--max-parallel", "2")
+
+    assert result.exit_code == 0, result.output
+    # each member is written to and run in its directory below run_dir
+    for member_id in (1, 2):
+        member_dir = tmp_path / "ens" / str(member_id)
+        assert (member_dir / f"exp_{member_id}.run").exists()
+        assert (member_dir / "cwd.txt").read_text().strip() == str(member_dir)
+
+
+def test_run_ensemble_serial_stops_at_failure(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "exp.run").write_text("seed=0\npwd > cwd.txt\nexit 1\n")
+
+    result = invoke_run_ensemble(tmp_path)
+
+    assert isinstance(result.exception, subprocess.CalledProcessError)
+    # the failed reference cancels the members by default
+    assert (tmp_path / "cwd.txt").exists()
+    assert not (tmp_path / "ens" / "1" / "cwd.txt").exists()
+
+
+def test_run_ensemble_stats_options(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "exp.run").write_text("seed=0\n")
+
+    result = invoke_run_ensemble(
+        tmp_path,
+        "--stats",
+        "--stats-file-name",
+        "stats_{member_id}.csv",
+        "--model-output-dir",
+        str(tmp_path),
+    )
+
+    # the missing option is reported before any model is run
+    assert result.exit_code == 2
+    assert "--stats needs --perturbed-model-output-dir" in result.output
+    assert not (tmp_path / "ens").exists()
 
 
 def test_prepare_perturbed_run_script_replaces_assignment_and_experiment(
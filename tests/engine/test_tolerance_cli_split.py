@@ -17,6 +17,11 @@ from tests.helpers import (
     run_tolerance_cli,
     store_as_potential_new_ref,
 )
+from util.dataframe_ops import (
+    check_file_with_tolerances,
+    parse_probtest_fof_observations,
+)
+from util.utils import FileInfo
 
 
 @pytest.mark.parametrize("use_minimum_tolerance", [True, False])
@@ -88,3 +93,36 @@ def test_tolerance_cli_fof(
     store_as_potential_new_ref(tolerance_files[0], new_ref)
 
     assert_empty_df(err, "Tolerance datasets are not equal!")
+
+
+def test_tolerance_cli_fof_grouped(fof_file_set, tmp_dir, monkeypatch):
+    """
+    Tolerances grouped by varno and codetype are the maximum of the tolerances
+    of the observations in each group and can be used by check.
+    """
+    monkeypatch.chdir(tmp_dir)
+    ref_file, member_file = fof_file_set["fof"][:2]
+    tolerance_file = os.path.join(tmp_dir, "tolerance_obs.csv")
+    grouped_file = os.path.join(tmp_dir, "tolerance_grouped.csv")
+
+    run_tolerance_cli(fof_file_set["path"], tolerance_file, member_ids="1,2,3,4")
+    run_tolerance_cli(
+        fof_file_set["path"],
+        grouped_file,
+        member_ids="1,2,3,4",
+        fof_group_by="varno,codetype",
+    )
+
+    df_groups = parse_probtest_fof_observations(ref_file, ("varno", "codetype"))
+    expected = (
+        df_groups.assign(veri_data=pd.read_csv(tolerance_file).iloc[:, 1])
+        .groupby(["varno", "codetype"])["veri_data"]
+        .max()
+        .reset_index()
+    )
+    pd.testing.assert_frame_equal(pd.read_csv(grouped_file, index_col=0), expected)
+
+    out, _, _ = check_file_with_tolerances(
+        grouped_file, FileInfo(ref_file), FileInfo(member_file), 1.0
+    )
+    assert out
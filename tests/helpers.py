@@ -27,6 +27,23 @@ from engine.select_members import select_members
 from engine.stats import stats
 from engine.tolerance import tolerance
 
+# --file-id and --file-specification of the NetCDF test data
+NETCDF_FILE_ARGS = [
+    "--file-id",
+    "NetCDF",
+    "*.nc",
+    "--file-specification",
+    [
+        {
+            "NetCDF": {
+                "format": "netcdf",
+                "time_dim": "time",
+                "horizontal_dims": ["lat", "lon"],
+            }
+        }
+    ],
+]
+
 
 def load_netcdf(path):
     return xr.load_dataset(path)
@@ -81,6 +98,27 @@ def assert_empty_df(df, msg):
     assert len(df.values) == 0, f"{msg}:\n{df}"
 
 
+def nan_check_dataframes(ref_val, cur_val):
+    """
+    Return the (tolerance, reference, current) DataFrames of a stats check in
+    which only the value of var_1 differs, with a tolerance large enough that
+    only NaN handling decides the outcome.
+    """
+    index = pd.MultiIndex.from_tuples(
+        [("f", "var_1", 0), ("f", "var_2", 0)],
+        names=["file_ID", "variable", "height"],
+    )
+    df_ref = pd.DataFrame({0: [ref_val, 1.0]}, index=index)
+    df_cur = pd.DataFrame({0: [cur_val, 1.0]}, index=index)
+    df_tol = pd.DataFrame(
+        {0: [1e3, 1e3]},
+        index=pd.MultiIndex.from_tuples(
+            [("f", "var_1"), ("f", "var_2")], names=["file_ID", "variable"]
+        ),
+    )
+    return df_tol, df_ref, df_cur
+
+
 def run_performance_cli(log_file, timing_database):
     args = [
         "--log_file",
@@ -98,6 +136,7 @@ def run_tolerance_cli(
     member_ids="1,2,3,4,5,6,7,8,9,10",
     fof_type="AIREP",
     minimum_tolerance=0.0,
+    fof_group_by=None,
 ):  # pylint: disable=too-many-positional-arguments
 
     args = [
@@ -115,6 +154,9 @@ def run_tolerance_cli(
     if member_type is not None:
         args.append("--member-type")
         args.append(member_type)
+    if fof_group_by is not None:
+        args.append("--fof-group-by")
+        args.append(fof_group_by)
     run_cli(tolerance, args)
 
 
@@ -122,7 +164,14 @@ def generate_ensemble(tmp_path, filename, perturb_amplitude):
     return run_perturb_cli(tmp_path, filename, perturb_amplitude)
 
 
-def run_perturb_cli(model_input_dir, files, perturb_amplitude, member_ids=range(1, 11)):
+def run_perturb_cli(
+    model_input_dir,
+    files,
+    perturb_amplitude,
+    member_ids=range(1, 11),
+    jobs=1,
+    pattern_store=None,
+):  # pylint: disable=too-many-positional-arguments
     perturbed_model_input_dir = f"{model_input_dir}/experiments/{{member_id}}"
     args = [
         "--model-input-dir",
@@ -140,7 +189,11 @@ def run_perturb_cli(model_input_dir, files, perturb_amplitude, member_ids=range(
         "--perturb-amplitude",
         f"{perturb_amplitude}",
         "--no-copy-all-files",
+        "--jobs",
+        str(jobs),
     ]
+    if pattern_store is not None:
+        args += ["--pattern-store", pattern_store]
     run_cli(perturb, args)
 
     return perturbed_model_input_dir
@@ -156,20 +209,7 @@ def run_stats_cli(
         stats_file_name,
         "--member-type",
         "dp",
-        "--file-id",
-        "NetCDF",
-        "*.nc",
-        "--file-specification",
-        [
-            {
-                "NetCDF": {
-                    "format": "netcdf",
-                    "time_dim": "time",
-                    "horizontal_dims": ["lat", "lon"],
-                }
-            }
-        ],
-    ]
+    ] + NETCDF_FILE_ARGS
     args += (
         ["--perturbed-model-output-dir", perturbed_model_output_dir]
         if perturbed_model_output_dir
@@ -0,0 +1,65 @@
+"""
+This module contains unit tests for the `util/checksum.py` module.
+"""
+
+import numpy as np
+import xarray as xr
+
+from util.checksum import (
+    array_checksum,
+    dataset_checksums,
+    files_identical,
+    identical_variables,
+)
+
+
+def test_files_identical(tmp_path):
+    file1 = tmp_path / "file1.nc"
+    file2 = tmp_path / "file2.nc"
+    file3 = tmp_path / "file3.nc"
+    file1.write_bytes(b"abc" * 1000)
+    file2.write_bytes(b"abc" * 1000)
+    file3.write_bytes(b"abc" * 999 + b"abd")
+
+    assert files_identical(file1, file2)
+    assert not files_identical(file1, file3)
+    assert not files_identical(file1, tmp_path / "missing.nc")
+
+
+def test_array_checksum():
+    """
+    Bit-identical arrays, NaN included, have the same checksum, arrays with
+    different values, dtypes or shapes do not.
+    """
+    arr = np.array([1.0, np.nan, 3.0])
+
+    assert array_checksum(arr) == array_checksum(arr.copy())
+    assert array_checksum(arr) != array_checksum(np.array([1.0, np.nan, 4.0]))
+    assert array_checksum(arr) != array_checksum(arr.astype(np.float32))
+    assert array_checksum(arr) != array_checksum(arr.reshape(3, 1))
+    assert array_checksum(np.array([b"a", b"b"], dtype=object)) == array_checksum(
+        np.array([b"a", b"b"], dtype=object)
+    )
+
+
+def test_identical_variables(sample_dataset_fof):
+    ds1 = sample_dataset_fof
+    ds2 = ds1.copy(deep=True)
+    ds2["flags"] = (("d_body",), ds2["flags"].values * 2)
+    ds2["statid"] = xr.DataArray(np.array(["a", "b", "c", "d", "e"]), dims="d_hdr")
+
+    assert identical_variables(ds1, ds2) == set(ds1.data_vars) - {"flags"}
+
+
+def test_dataset_checksums_block_wise(sample_dataset_fof, tmp_path):
+    """
+    Hashing a lazily opened dataset block by block gives the checksums of the
+    whole arrays.
+    """
+    sample_dataset_fof.to_netcdf(tmp_path / "fof.nc")
+
+    with xr.open_dataset(tmp_path / "fof.nc") as ds:
+        checksums = dataset_checksums(ds, block_bytes=16)
+        expected = {var: array_checksum(ds[var].values) for var in ds.data_vars}
+
+    assert checksums == expected
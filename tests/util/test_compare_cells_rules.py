@@ -0,0 +1,59 @@
+"""
+This module contains unit tests for the rule-based comparison in
+`util/dataframe_ops.py`.
+"""
+
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+
+from util.fof_utils import compare_cells_rules
+
+
+def test_compare_cells_rules():
+    """
+    Only differences not admitted by the rules are reported, in the order of
+    the rows.
+    """
+    ref_df = pd.DataFrame({"check": [9, 9, 9, 9], "state": [13, 13, 13, 13]})
+    cur_df = pd.DataFrame({"check": [9, 1, 6, 9], "state": [14, 13, 13, 2]})
+    rules = {"check": [9, 1], "state": [13, 14]}
+    detailed_logger = MagicMock()
+
+    errors = compare_cells_rules(
+        ref_df, cur_df, ["check", "state"], rules, detailed_logger
+    )
+
+    assert errors
+    logged = [c.args[1:] for c in detailed_logger.info.call_args_list]
+    assert logged == [(2, "check", 9, 6), (3, "state", 13, 2)]
+
+
+def test_compare_cells_rules_capped_log():
+    """
+    Only the first differences are logged in detail, followed by a summary.
+    """
+    ref_df = pd.DataFrame({"check": np.zeros(1000, dtype=int)})
+    cur_df = pd.DataFrame({"check": np.ones(1000, dtype=int)})
+    detailed_logger = MagicMock()
+
+    errors = compare_cells_rules(
+        ref_df, cur_df, ["check"], {}, detailed_logger, max_logged_differences=10
+    )
+
+    assert errors
+    assert detailed_logger.info.call_count == 11
+    assert detailed_logger.info.call_args.args[1:] == (990, "check=1000")
+
+
+def test_compare_cells_rules_equal():
+    ref_df = pd.DataFrame({"check": [9, 1], "state": [13, 14]})
+    detailed_logger = MagicMock()
+
+    errors = compare_cells_rules(
+        ref_df, ref_df.copy(), ["check", "state"], {}, detailed_logger
+    )
+
+    assert not errors
+    detailed_logger.info.assert_not_called()
@@ -12,12 +12,15 @@ import pandas as pd
 import pytest
 import xarray as xr
 
+from tests.helpers import nan_check_dataframes
 from util.constants import CHECK_THRESHOLD
 from util.dataframe_ops import (
     check_file_with_tolerances,
     check_intersection,
     check_multiple_solutions_from_dict,
+    check_stats_files_with_tolerances,
     check_variable,
+    check_variable_blocks,
     compute_division,
     compute_rel_diff_dataframe,
     df_from_file_ids,
@@ -30,7 +33,7 @@ from util.dataframe_ops import (
     split_feedback_dataset,
     unify_time_index,
 )
-from util.utils import FileType
+from util.utils import FileInfo, FileType
 
 
 @pytest.fixture(name="_tmp_netcdf_files", scope="function")
@@ -565,19 +568,7 @@ def test_check_file_nan_vs_non_nan(mock_parse_check, ref_val, cur_val, expected_
     Drives check_file_with_tolerances directly with a generous tolerance so only the
     NaN handling -- not the magnitude -- decides the outcome.
     """
-    index = pd.MultiIndex.from_tuples(
-        [("f", "var_1", 0), ("f", "var_2", 0)],
-        names=["file_ID", "variable", "height"],
-    )
-    df_ref = pd.DataFrame({0: [ref_val, 1.0]}, index=index)
-    df_cur = pd.DataFrame({0: [cur_val, 1.0]}, index=index)
-    df_tol = pd.DataFrame(
-        {0: [1e3, 1e3]},
-        index=pd.MultiIndex.from_tuples(
-            [("f", "var_1"), ("f", "var_2")], names=["file_ID", "variable"]
-        ),
-    )
-    mock_parse_check.return_value = (df_tol, df_ref, df_cur)
+    mock_parse_check.return_value = nan_check_dataframes(ref_val, cur_val)
 
     ref = WithPath("ref.csv", file_type=FileType.STATS)
     cur = WithPath("cur.csv", file_type=FileType.STATS)
@@ -587,6 +578,23 @@ def test_check_file_nan_vs_non_nan(mock_parse_check, ref_val, cur_val, expected_
     assert out is expected_pass
 
 
+def test_check_variable_blocks(stats_dataframes):
+    """
+    The block-wise check stops at the first failing file_ID/variable block and
+    agrees with the check of the whole DataFrames.
+    """
+    df1, df2, tol_large, tol_small = stats_dataframes
+    tol_large = pd.concat([tol_large], keys=["NetCDF:*atm_3d*.nc"])
+    tol_small = pd.concat([tol_small], keys=["NetCDF:*atm_3d*.nc"])
+
+    assert check_variable_blocks(df1, df2, tol_large)[0]
+    out, err, _ = check_variable_blocks(df1, df2, tol_small)
+    diff_df = compute_rel_diff_dataframe(df1, df2).groupby(["file_ID", "variable"])
+    _, err_full, _ = check_variable(diff_df.max(), tol_small)
+    assert not out
+    pd.testing.assert_frame_equal(err, err_full.iloc[:1], check_names=False)
+
+
 def test_check_variable():
     diff_df = pd.DataFrame([[1.0, 3.0], [2.0, 4.0]], columns=["A", "B"])
     df_tol = pd.DataFrame([[1.0, 3.0], [1.0, 5.0]], columns=["A", "B"])
@@ -924,3 +932,63 @@ def test_multiple_solutions_from_dict_with_rules_wrong(dataframes_dict):
         )
 
     assert errors is True
+
+
+def write_stats_files(tmp_path, tol_large, dfs):
+    tol = pd.concat([tol_large], keys=["NetCDF:*atm_3d*.nc"], names=["file_ID"])
+    tol.index.names = ["file_ID", "variable"]
+    tol_file = tmp_path / "tol.csv"
+    tol.to_csv(tol_file)
+    files = [tmp_path / f"stats_{i}.csv" for i in range(len(dfs))]
+    for df, f in zip(dfs, files):
+        df.to_csv(f)
+    return tol_file, files
+
+
+def test_check_stats_files_with_tolerances(stats_dataframes, tmp_path):
+    """
+    The batched check must give the same verdict as checking each file
+    separately and report the variables exceeding the tolerance.
+    """
+    df1, df2, tol_large, _ = stats_dataframes
+    df3 = df1.copy()
+    df3.loc[("NetCDF:*atm_3d*.nc", "var_2", 0), (1, "mean")] *= 2.0
+
+    tol_file, files = write_stats_files(tmp_path, tol_large, [df1, df2, df3])
+    ref = FileInfo(str(files[0]))
+    cur = [FileInfo(str(f)) for f in files]
+
+    passed, failed_variables = check_stats_files_with_tolerances(
+        str(tol_file), ref, cur, 1.0
+    )
+
+    assert passed == [True, True, False]
+    assert failed_variables == [[], [], ["var_2"]]
+    for info, out in zip(cur, passed):
+        assert check_file_with_tolerances(str(tol_file), ref, info, 1.0)[0] == out
+
+
+def test_check_stats_files_with_tolerances_different_lengths(
+    stats_dataframes, tmp_path
+):
+    """
+    Each file is compared on the time steps it shares with the reference, a
+    shorter file does not hide failures at later time steps of the others.
+    """
+    df1, _, tol_large, _ = stats_dataframes
+    df_fail = df1.copy()
+    df_fail.loc[("NetCDF:*atm_3d*.nc", "var_2", 0), (1, "mean")] *= 2.0
+    df_short = df1.loc[:, [0]]
+
+    tol_file, files = write_stats_files(tmp_path, tol_large, [df1, df_fail, df_short])
+    ref = FileInfo(str(files[0]))
+    cur = [FileInfo(str(f)) for f in files[1:]]
+
+    passed, failed_variables = check_stats_files_with_tolerances(
+        str(tol_file), ref, cur, 1.0
+    )
+
+    assert passed == [False, True]
+    assert failed_variables == [["var_2"], []]
+    for info, out in zip(cur, passed):
+        assert check_file_with_tolerances(str(tol_file), ref, info, 1.0)[0] == out
@@ -0,0 +1,50 @@
+"""
+This module contains unit tests for the `util/file_links.py` module.
+"""
+
+import os
+import shutil
+
+import pytest
+
+from util.file_links import LINK_MODES, link_file
+
+
+@pytest.fixture(name="src_file")
+def fixture_src_file(tmp_path):
+    (tmp_path / "input").mkdir()
+    (tmp_path / "member").mkdir()
+    src = tmp_path / "input" / "grid.nc"
+    src.write_bytes(b"grid data")
+    return src
+
+
+@pytest.mark.parametrize("mode", LINK_MODES)
+def test_link_file(src_file, mode):
+    dst = link_file(str(src_file), str(src_file.parent.parent / "member"), mode)
+
+    assert os.path.basename(dst) == "grid.nc"
+    with open(dst, "rb") as f:
+        assert f.read() == b"grid data"
+    assert os.path.islink(dst) == (mode == "symlink")
+    assert os.path.samefile(dst, src_file) == (mode in ("hardlink", "symlink"))
+
+
+@pytest.mark.parametrize("mode", LINK_MODES)
+def test_link_file_replaces_existing_link(src_file, mode):
+    member_dir = str(src_file.parent.parent / "member")
+    link_file(str(src_file), member_dir, "hardlink")
+
+    dst = link_file(str(src_file), member_dir, mode)
+
+    with open(dst, "rb") as f:
+        assert f.read() == b"grid data"
+    assert src_file.read_bytes() == b"grid data"
+
+
+@pytest.mark.parametrize("mode", LINK_MODES)
+def test_link_file_same_file(src_file, mode):
+    with pytest.raises(shutil.SameFileError):
+        link_file(str(src_file), str(src_file.parent), mode)
+
+    assert src_file.read_bytes() == b"grid data"
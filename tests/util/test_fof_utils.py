@@ -2,19 +2,26 @@
 This module contains unit tests for the `util/fof_utils.py` module.
 """
 
-from unittest.mock import mock_open, patch
+from unittest.mock import MagicMock, mock_open, patch
 
 import numpy as np
 import pytest
+import xarray as xr
 
 from util.fof_utils import (  # write_lines,
     clean_value,
     compare_arrays,
+    compare_arrays_chunked,
     compare_var_and_attr_ds,
     get_observation_variables,
     get_report_variables,
+    lexsort_permutation,
+    open_feedback_dataset,
+    read_classic_netcdf,
     replace_nan_with_sentinel_float64,
+    sort_observations,
     split_feedback_dataset,
+    write_lines_log,
 )
 from util.log_handler import initialize_detailed_logger
 
@@ -133,6 +140,22 @@ def test_split_report(ds1, ds_report, ds_obs):
     assert reports == ds_report and observations == ds_obs
 
 
+@pytest.mark.parametrize("dtype", ["S", "U", "O"])
+def test_lexsort_permutation(dtype):
+    """
+    Test that the permutation sorts by the keys in order of significance,
+    strings included, and keeps the order of equal elements.
+    """
+    statid = np.array(["b", "ab", "a", "ab", "b", "abc"]).astype(dtype)
+    if dtype == "O":
+        statid = np.array([s.encode() for s in statid], dtype=object)
+    lat = np.array([1.0, 0.0, 1.0, 0.0, 1.0, np.nan])
+
+    perm = lexsort_permutation([lat, statid])
+
+    np.testing.assert_array_equal(perm, [1, 3, 2, 0, 4, 5])
+
+
 @pytest.fixture(name="arr1", scope="function")
 def fixture_arr1():
     return np.array([1.0, 5.0, 3.0, 4.0, 7.0], dtype=np.float32)
@@ -252,6 +275,12 @@ def test_compare_var_and_attr_ds(ds1, ds2):
 
         assert (total1, equal1) == (103, 102)
 
+        # skipping identical variables gives the same counts
+        identical = set(ds1.data_vars) - {"codetype"}
+        assert compare_var_and_attr_ds(
+            ds1, ds2, detailed_logger, identical_variables=identical
+        ) == (103, 102)
+
 
 @pytest.fixture(name="ds3")
 def fixture_sample_dataset_3(sample_dataset_fof):
@@ -262,3 +291,89 @@ def fixture_sample_dataset_3(sample_dataset_fof):
     ds.attrs["plevel"] = np.array([0.374, 0.950, 0.731, 0.598, 0.156])
 
     return ds
+
+
+def test_write_lines_log_capped(ds1, ds2):
+    """
+    Only the first differing rows are written in detail, followed by the
+    number of rows left out.
+    """
+    detailed_logger = MagicMock()
+    diff = np.arange(ds2.sizes["d_hdr"])
+    ds1, ds2 = ds1[["codetype", "lat"]], ds2[["codetype", "lat"]]
+
+    write_lines_log(ds1, ds2, diff, detailed_logger, max_logged_differences=2)
+
+    written = [c.args[0] for c in detailed_logger.info.call_args_list]
+    assert written[0].count("ref  : ") == 2
+    assert detailed_logger.info.call_args.args[1:] == (diff.size - 2, 2)
+
+
+def test_compare_arrays_chunked(ds1):
+    """
+    The block-wise comparison counts the same equal values and finds the same
+    first differences as comparing the whole arrays.
+    """
+    var1 = ds1["veri_data"].variable
+    var2 = var1.copy(data=np.array([45, 0, 45, 0, 0, 78]))
+
+    total, equal, diff = compare_arrays_chunked(var1, var2, "veri_data", 4, 2)
+    total_all, equal_all, diff_all = compare_arrays(var1.values, var2.values, "")
+
+    assert (total, equal) == (total_all, equal_all) == (6, 3)
+    np.testing.assert_array_equal(diff, diff_all[:2])
+
+
+def test_compare_arrays_chunked_orders(ds1):
+    """
+    With orders, the rows are compared in these orders, reading one block of
+    at most chunk_size rows at a time.
+    """
+    variable = ds1["veri_data"].variable
+    var1 = MagicMock(shape=variable.shape)
+    var1.__getitem__.side_effect = lambda rows: variable[rows]
+    order1 = np.array([5, 4, 3, 2, 1, 0])
+    var2 = variable.copy(data=np.array([78, 0, 0, 45, 34, 45]))
+
+    total, equal, diff = compare_arrays_chunked(
+        var1, var2, "veri_data", 4, 10, orders=(order1, np.arange(6))
+    )
+
+    assert (total, equal) == (6, 4)
+    np.testing.assert_array_equal(diff, [1, 2])
+    assert [call.args[0].size for call in var1.__getitem__.call_args_list] == [4, 2]
+
+
+def test_sort_observations(ds1):
+    """
+    Selected observation variables are sorted and expanded like the
+    observations of split_feedback_dataset.
+    """
+    _, observations = split_feedback_dataset(ds1)
+
+    selected = sort_observations(ds1, ["veri_data", "statid"])
+
+    assert selected.identical(observations[["veri_data", "statid"]])
+
+
+@pytest.mark.parametrize("file_format", ["NETCDF3_CLASSIC", "NETCDF3_64BIT"])
+def test_open_feedback_dataset_classic(ds1, tmp_path, file_format):
+    """
+    Classic files are memory-mapped and decoded exactly like xr.open_dataset.
+    """
+    path = tmp_path / "fof.nc"
+    ds1.to_netcdf(path, format=file_format)
+
+    _, _, variables = read_classic_netcdf(path)
+    _, view, _ = variables["veri_data"]
+    assert isinstance(view.base, np.memmap) and not view.flags.writeable
+
+    with xr.open_dataset(path) as expected, open_feedback_dataset(path) as ds:
+        xr.testing.assert_identical(ds, expected)
+
+
+def test_read_classic_netcdf_hdf5(ds1, tmp_path):
+    path = tmp_path / "fof.nc"
+    ds1.to_netcdf(path, format="NETCDF4")
+
+    assert read_classic_netcdf(path) is None
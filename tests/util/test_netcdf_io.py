@@ -0,0 +1,71 @@
+"""
+This module contains unit tests for the `util/netcdf_io.py` module.
+"""
+
+import numpy as np
+from netCDF4 import Dataset  # pylint: disable=no-name-in-module
+
+from util.netcdf_io import hyperslabs, nc4_get_copy
+
+
+def write_input_file(path):
+    with Dataset(path, "w") as d:
+        d.createDimension("time", None)
+        d.createDimension("x", 10)
+        t = d.createVariable(
+            "T",
+            np.float32,
+            ("time", "x"),
+            zlib=True,
+            complevel=3,
+            chunksizes=(1, 5),
+            fill_value=np.float32(-1),
+        )
+        t.valid_max = np.float32(100)
+        t[:] = np.ma.masked_array(
+            np.arange(30).reshape(3, 10), mask=np.arange(30) % 7 == 0
+        )
+        n = d.createVariable("N", np.int16, ("x",))
+        n.scale_factor = 0.5
+        n[:] = np.arange(10)
+
+
+def test_nc4_get_copy_promotes_selected_variables(tmp_path):
+    write_input_file(tmp_path / "in.nc")
+
+    nc4_get_copy(tmp_path / "in.nc", tmp_path / "out.nc", ["T"]).close()
+
+    with Dataset(tmp_path / "in.nc") as din, Dataset(tmp_path / "out.nc") as dout:
+        din.set_auto_maskandscale(False)
+        dout.set_auto_maskandscale(False)
+
+        assert dout["T"].dtype == np.float64
+        assert isinstance(dout["T"].valid_max, np.float64)
+        assert dout["T"].chunking() == [1, 5]
+        assert dout["T"].filters()["zlib"]
+        np.testing.assert_array_equal(dout["T"][:], din["T"][:])
+
+        assert dout["N"].dtype == np.int16
+        assert dout["N"].scale_factor == 0.5
+        np.testing.assert_array_equal(dout["N"][:], din["N"][:])
+
+
+def test_nc4_get_copy_promotes_all_variables_by_default(tmp_path):
+    write_input_file(tmp_path / "in.nc")
+
+    nc4_get_copy(tmp_path / "in.nc", tmp_path / "out.nc").close()
+
+    with Dataset(tmp_path / "out.nc") as dout:
+        assert dout["T"].dtype == np.float64
+        assert dout["N"].dtype == np.float64
+
+
+def test_hyperslabs():
+    assert list(hyperslabs((), 8)) == [()]
+    assert list(hyperslabs((5, 4), 8, chunk_bytes=64)) == [
+        (slice(0, 2),),
+        (slice(2, 4),),
+        (slice(4, 5),),
+    ]
+    # a single index is the smallest hyperslab
+    assert len(list(hyperslabs((3, 100), 8, chunk_bytes=64))) == 3
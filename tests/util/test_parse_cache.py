@@ -0,0 +1,145 @@
+"""
+This module contains unit tests for the `util/parse_cache.py` module.
+"""
+
+import pickle
+from unittest.mock import Mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from util.dataframe_ops import parse_cached, parsed_nbytes
+from util.parse_cache import ParseCache, file_content_hash
+
+
+def test_parse_cache_reuses_snapshot(tmp_path):
+    """
+    A second cache on the same directory (i.e. a later invocation) reads the
+    parsed data from the snapshot instead of parsing the file again.
+    """
+    path = tmp_path / "tolerance.csv"
+    pd.DataFrame({"a": [1.0, 2.0]}).to_csv(path)
+    parser = Mock(side_effect=pd.read_csv, __qualname__="read_csv")
+
+    df1 = ParseCache(tmp_path / "cache").load(parser, path, index_col=0)
+    df2 = ParseCache(tmp_path / "cache").load(parser, path, index_col=0)
+
+    assert parser.call_count == 1
+    pd.testing.assert_frame_equal(df1, df2)
+
+
+def test_parse_cache_format_version(tmp_path, monkeypatch):
+    """
+    Snapshots written with another cache format version, i.e. by parsers of
+    another version of probtest, are not used.
+    """
+    path = tmp_path / "tolerance.csv"
+    pd.DataFrame({"a": [1.0, 2.0]}).to_csv(path)
+    parser = Mock(side_effect=pd.read_csv, __qualname__="read_csv")
+
+    ParseCache(tmp_path / "cache").load(parser, path, index_col=0)
+    monkeypatch.setattr("util.parse_cache.CACHE_FORMAT_VERSION", 0)
+    ParseCache(tmp_path / "cache").load(parser, path, index_col=0)
+
+    assert parser.call_count == 2
+
+
+def test_parse_cache_detects_changes(tmp_path):
+    """
+    A rewritten file is parsed again.
+    """
+    path = tmp_path / "tolerance.csv"
+    pd.DataFrame({"a": [1.0, 2.0]}).to_csv(path)
+    parser = Mock(side_effect=pd.read_csv, __qualname__="read_csv")
+    cache = ParseCache(tmp_path / "cache")
+
+    cache.load(parser, path, index_col=0)
+    pd.DataFrame({"a": [3.0, 4.0, 5.0]}).to_csv(path)
+    df = cache.load(parser, path, index_col=0)
+
+    assert parser.call_count == 2
+    assert list(df["a"]) == [3.0, 4.0, 5.0]
+    assert cache.content_hash(path) == file_content_hash(path)
+
+
+@pytest.mark.parametrize(
+    "content",
+    # the second refers to a class which does not exist anymore, as in snapshots
+    # written by other versions of pandas, numpy or probtest
+    [b"corrupt", b"cremoved_module\nParsedData\n(tR."],
+    ids=["corrupt", "incompatible"],
+)
+def test_parse_cache_ignores_broken_snapshot(tmp_path, content):
+    """
+    A snapshot which cannot be unpickled is dropped and the file parsed again.
+    """
+    path = tmp_path / "tolerance.csv"
+    pd.DataFrame({"a": [1.0, 2.0]}).to_csv(path)
+    parser = Mock(side_effect=pd.read_csv, __qualname__="read_csv")
+    cache = ParseCache(tmp_path / "cache")
+    cache.load(parser, path, index_col=0)
+
+    (snapshot,) = (tmp_path / "cache").glob("*.pkl")
+    snapshot.write_bytes(content)
+    df = cache.load(parser, path, index_col=0)
+
+    assert parser.call_count == 2
+    assert list(df["a"]) == [1.0, 2.0]
+    with open(snapshot, "rb") as f:
+        pd.testing.assert_frame_equal(pickle.load(f), df)
+
+
+def test_parse_cache_evicts_least_recently_used(tmp_path):
+    """
+    Only the most recently used snapshot is kept if the size limit is small.
+    """
+    paths = [tmp_path / f"tolerance_{i}.csv" for i in range(3)]
+    for i, path in enumerate(paths):
+        pd.DataFrame({"a": [float(i)] * 100}).to_csv(path)
+    cache = ParseCache(tmp_path / "cache", max_size_mb=1e-6)
+
+    for path in paths:
+        cache.load(pd.read_csv, path, index_col=0)
+
+    snapshots = list((tmp_path / "cache").glob("*.pkl"))
+    assert len(snapshots) <= 1
+
+
+def test_parse_cached(tmp_path):
+    """
+    A file is parsed once as long as it is unchanged, and parsed again after
+    it has been rewritten.
+    """
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"a": [1.0, 2.0]}).to_csv(path)
+
+    parser = Mock(side_effect=pd.read_csv)
+
+    df1 = parse_cached(parser, path, index_col=0)
+    df2 = parse_cached(parser, path, index_col=0)
+
+    assert parser.call_count == 1
+    assert df2 is df1
+
+    pd.DataFrame({"a": [3.0, 4.0, 5.0]}).to_csv(path)
+    df3 = parse_cached(parser, path, index_col=0)
+
+    assert parser.call_count == 2
+    assert list(df3["a"]) == [3.0, 4.0, 5.0]
+
+
+def test_parse_cached_max_bytes(tmp_path, monkeypatch):
+    """The least recently used files are dropped beyond PARSE_CACHE_MAX_BYTES."""
+    paths = [tmp_path / f"data_{i}.csv" for i in range(3)]
+    for path in paths:
+        pd.DataFrame({"a": np.arange(100.0)}).to_csv(path)
+    nbytes = parsed_nbytes(pd.read_csv(paths[0], index_col=0))
+    monkeypatch.setattr("util.dataframe_ops.PARSE_CACHE_MAX_BYTES", 2 * nbytes)
+
+    parser = Mock(side_effect=pd.read_csv)
+    for path in paths + paths[2:] + paths[:1]:
+        parse_cached(parser, path, index_col=0)
+
+    # the third file drops the first one, which is parsed again at the end
+    assert parser.call_count == 4
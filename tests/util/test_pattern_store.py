@@ -0,0 +1,51 @@
+"""
+This module contains unit tests for the `util/pattern_store.py` module.
+"""
+
+import json
+from unittest.mock import Mock
+
+import numpy as np
+
+from engine.perturb import perturbation_pattern
+from util.checksum import array_checksum
+from util.pattern_store import PatternStore
+
+
+def test_pattern_store_generates_each_pattern_once(tmp_path):
+    generate = Mock(side_effect=perturbation_pattern, __qualname__="pattern")
+    store = PatternStore(tmp_path / "patterns")
+
+    p1 = store.load(generate, (10, 4), 3, 1e-3)
+    p2 = store.load(generate, (10, 4), 3, 1e-3)
+    p3 = store.load(generate, (10, 4), 4, 1e-3)
+
+    assert generate.call_count == 2
+    assert p1 is p2
+    assert not np.array_equal(p1, p3)
+
+
+def test_pattern_store_records_pattern(tmp_path):
+    generate = Mock(side_effect=perturbation_pattern, __qualname__="pattern")
+
+    p1 = PatternStore(tmp_path / "patterns").load(generate, (10, 4), 3, 1e-3)
+    p2 = PatternStore(tmp_path / "patterns").load(generate, (10, 4), 3, 1e-3)
+
+    # only the parameters and the checksum are stored, the pattern is
+    # regenerated by each setup
+    assert generate.call_count == 2
+    np.testing.assert_array_equal(p1, p2)
+    (record_file,) = (tmp_path / "patterns").iterdir()
+    assert record_file.suffix == ".json"
+    assert json.loads(record_file.read_text())["checksum"] == array_checksum(p1)
+
+
+def test_pattern_store_detects_changed_pattern(tmp_path, caplog):
+    generate = Mock(side_effect=perturbation_pattern, __qualname__="pattern")
+    PatternStore(tmp_path / "patterns").load(generate, (10, 4), 3, 1e-3)
+
+    generate.side_effect = lambda shape, seed, amplitude: np.ones(shape)
+    pattern = PatternStore(tmp_path / "patterns").load(generate, (10, 4), 3, 1e-3)
+
+    np.testing.assert_array_equal(pattern, np.ones((10, 4)))
+    assert "differs from the recorded one" in caplog.text
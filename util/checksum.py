@@ -0,0 +1,92 @@
+"""
+This module provides checksums to detect identical files and variables
+cheaply, before parsing and comparing them in full.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from util.netcdf_io import hyperslabs
+
+# maximum number of bytes of a variable read and hashed at once
+CHECKSUM_BLOCK_BYTES = 1 << 24
+
+
+def files_identical(path1, path2, chunk_size=1 << 20):
+    """
+    Check whether two files have the same content, streaming both files
+    chunk by chunk and stopping at the first difference. Files which cannot
+    be read are not identical, leaving the error to the actual comparison.
+    """
+    try:
+        if os.path.samefile(path1, path2):
+            return True
+        if os.path.getsize(path1) != os.path.getsize(path2):
+            return False
+
+        with open(path1, "rb") as f1, open(path2, "rb") as f2:
+            while True:
+                chunk1 = f1.read(chunk_size)
+                if chunk1 != f2.read(chunk_size):
+                    return False
+                if not chunk1:
+                    return True
+    except OSError:
+        return False
+
+
+def array_checksum(values):
+    """
+    Hash the data of an array together with its dtype and shape, so that two
+    arrays have the same checksum if and only if they are bit-identical.
+    """
+    values = np.asarray(values)
+    h = _checksum_hash(values.dtype, values.shape)
+    if values.dtype.hasobject:
+        h.update(repr(values.tolist()).encode())
+    else:
+        h.update(np.ascontiguousarray(values).view(np.uint8).data)
+    return h.hexdigest()
+
+
+def _checksum_hash(dtype, shape):
+    return hashlib.blake2b(f"{dtype.str}{shape}".encode(), digest_size=16)
+
+
+def variable_checksum(variable, block_bytes=CHECKSUM_BLOCK_BYTES):
+    """
+    Compute array_checksum of an xarray variable, reading and hashing it in
+    hyperslabs along its first dimension. For lazily opened datasets, only one
+    block of at most block_bytes bytes is loaded into memory at a time.
+    """
+    if variable.dtype.hasobject or variable.ndim == 0:
+        return array_checksum(variable.values)
+
+    h = _checksum_hash(variable.dtype, variable.shape)
+    for hyperslab in hyperslabs(variable.shape, variable.dtype.itemsize, block_bytes):
+        block = np.ascontiguousarray(variable[hyperslab].values)
+        h.update(block.view(np.uint8).data)
+    return h.hexdigest()
+
+
+def dataset_checksums(ds, block_bytes=CHECKSUM_BLOCK_BYTES):
+    """Compute the checksum of each data variable of an xarray dataset."""
+    return {
+        var: variable_checksum(ds[var].variable, block_bytes) for var in ds.data_vars
+    }
+
+
+def identical_variables(ds1, ds2, block_bytes=CHECKSUM_BLOCK_BYTES):
+    """
+    Return the names of the data variables which are bit-identical in both
+    datasets, comparing their checksums, which are computed block by block.
+    """
+    checksums1 = dataset_checksums(ds1, block_bytes)
+    checksums2 = dataset_checksums(ds2, block_bytes)
+    return {
+        var
+        for var, checksum in checksums1.items()
+        if checksums2.get(var) == checksum and ds1[var].dims == ds2[var].dims
+    }
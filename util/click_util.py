@@ -111,6 +111,9 @@ cli_help = {
     "ensemble_files": r"List containing the name of the stats file and the fof file"
     + r" representing the ensemble.",
     "stats_file_name": r"The name of the stats file to be created.",
+    "archive_stats_file_name": r"If set, the stats of the model output are also "
+    + r"written to this file (in the background) for archiving. '\{member_id\}' "
+    + r"is replaced by the name of the model output directory.",
     "member_count": r"Count of ensemble members " + r'(e.g. "10").',
     "member_id": r"ID of ensemble member " + r'(e.g. "3").',
     "member_ids": r"List of member ids" + r'(e.g. "1,3,14")',
@@ -119,10 +122,22 @@ cli_help = {
     + r"The type is part of the created member_id, which is equal to "
     + r"(member_type + '_' + str(member_id)).",
     "perturb_amplitude": r"The amplitude of the relative perturbation.",
+    "rng": r"The random number generator of the perturbation: 'legacy' (the "
+    + r"global NumPy random state, reproducing earlier ensembles) or 'philox' "
+    + r"(counter-based, drawn block by block and applied in place).",
+    "pattern_store": r"Directory in which the parameters and the checksum of the "
+    + r"perturbation pattern of each member and grid are recorded. Each pattern "
+    + r"is generated once for all variables and files on the same grid, and a "
+    + r"pattern differing from the recorded one is reported.",
     "files": r"The files that need to be perturbed.",
     "variable_names": r"The variables that are perturbed.",
     "copy_all_files": r"Copy all files from the model_input_dir directory to the "
     + r"perturbed_model_input_dir.",
+    "link_mode": r"How --copy-all-files places the unperturbed files in the member "
+    + r"directories: 'copy', 'hardlink', 'reflink' (copy-on-write clone where the "
+    + r"file system supports it) or 'symlink'. Files which cannot be linked are "
+    + r"copied. Hard and symbolic links share the data with model_input_dir, so "
+    + r"the linked files must not be modified in place.",
     "file_id": r"A unique identifier and file pattern FILE_PATTERN of the files "
     + r"containing the variables to be analysed and the file specification label "
     + r"FILE_TYPE. FILE_PATTERN may contain simple shell-style wildcards such as "
@@ -168,6 +183,23 @@ cli_help = {
     "rhs_old": r"Define old right hand side (optional, put None if not needed).",
     "submit_command": r"How a model simulation is submitted.",
     "parallel": r"Run jobs in parallel.",
+    "max_parallel": r"Maximum number of model runs at the same time, the next run "
+    + r"starts as soon as one has finished (default: 1, or all with --parallel).",
+    "resume": r"Skip the model runs which have already finished successfully with "
+    + r"an unchanged runscript, as recorded in the marker file "
+    + r"'<runscript>.status.json' written after each run.",
+    "run_stats": r"Compute the stats file of each model run as soon as the run has "
+    + r"finished successfully, while the other runs are still going on (like "
+    + r"'stats --ensemble').",
+    "on_failure": r"What to do if a model run fails: 'continue' with the other "
+    + r"runs or 'cancel' the running and remaining ones (default: 'cancel' if "
+    + r"only one model runs at a time, 'continue' otherwise).",
+    "jobs": r"Number of worker processes to use (default: 1, i.e. serial).",
+    "cache_dir": r"Directory in which parsed reference and tolerance files are "
+    + r"cached across invocations (can also be set by PROBTEST_CACHE_DIR). "
+    + r"Disabled if not set.",
+    "cache_max_size": r"Maximum total size of the parse cache in MB "
+    + r"(can also be set by PROBTEST_CACHE_MAX_SIZE).",
     "dry": r"Only generate runscripts, do not run the model.",
     "savedir": r"The directory where the plots are stored.",
     "cdo_table_file": r"File to store the cdo table into.",
@@ -189,7 +221,16 @@ cli_help = {
     + r"than the reference before a warning gets printed.",
     "minimum_tolerance": r"Non-zero value to set variable tolerances to when the "
     + r"calculated tolerances from the ensemble are exactly zero.",
+    "fof_group_by": r"Comma-separated observation variables (e.g. varno,codetype) "
+    + r"by which the tolerances of fof files are grouped, writing one tolerance "
+    + r"per group instead of one per observation.",
     "verbose": r"Always provide the full DataFrame output.",
+    "fail_fast": r"Stop at the first variable (and the first file) exceeding its "
+    + r"tolerance.",
+    "summary_only": r"Only report whether the check passed, without computing and "
+    + r"printing the differences.",
+    "max_logged_differences": r"Maximum number of differences per variable written "
+    + r"in detail to the error log of fof files.",
     "rules": (
         "JSON object specifying the rules for comparison. "
         'Example: \'{"check":[13,18,32],"state":[1,5,7,9]}\''
@@ -5,30 +5,55 @@ It includes utilities to handle data reading, processing, and comparison against
 reference datasets with specified tolerances.
 """
 
+import os
 import sys
 import warnings
+from collections import OrderedDict
 from typing import Optional
 
 import numpy as np
 import pandas as pd
-import xarray as xr
 
+from util.checksum import files_identical
 from util.constants import CHECK_THRESHOLD, compute_statistics
 from util.file_system import file_names_from_pattern
 from util.fof_utils import (
+    COMPARE_CHUNK_SIZE,
+    MAX_LOGGED_DIFFERENCES,
+    OBSERVATION_SORT_KEYS,
+    REPORT_SORT_KEYS,
     clean_logger_file_if_only_details,
-    compare_var_and_attr_ds,
+    compare_sorted_columns_with_rules,
+    dataframe_columns,
+    expand_fof_tolerance,
+    feedback_sort_orders,
+    get_detailed_logger_name,
     get_log_file_name,
+    open_feedback_dataset,
+    sort_observations,
+    sorted_column_values,
+    sorted_feedback_columns,
     split_feedback_dataset,
 )
-from util.log_handler import initialize_detailed_logger, logger
+from util.log_handler import (
+    close_detailed_logger,
+    initialize_detailed_logger,
+    logger,
+)
 from util.model_output_parser import model_output_parser
+from util.parse_cache import DEFAULT_CACHE_MAX_SIZE_MB, ParseCache
 from util.utils import FileInfo, FileType
 
 pd.set_option("display.max_colwidth", None)
 pd.set_option("display.max_columns", None)
 pd.set_option("display.float_format", lambda x: f"{x:,.2e}")
 
+# maximum number of bytes of parsed files kept in memory by parse_cached
+PARSE_CACHE_MAX_BYTES = 1 << 30
+_parse_cache: OrderedDict = OrderedDict()
+# optional persistent cache, see enable_persistent_parse_cache
+_persistent_parse_cache: Optional[ParseCache] = None  # pylint: disable=invalid-name
+
 
 def force_monotonic(dataframe):
     stats = list(dataframe.columns.levels[1])
@@ -66,8 +91,16 @@ def parse_probtest_stats(path, index_col=None):
 
     # the dataframe's time column will be read as string,
     # thus ordered like "0", "1", "10", "11", .. "2", ...
+    return sort_stats_columns(df)
+
+
+def sort_stats_columns(df):
+    """
+    Order the (time, statistic) columns of a stats DataFrame by time and
+    statistic, i.e. like a stats file parsed by parse_probtest_stats.
+    """
     new_cols = pd.MultiIndex.from_product(
-        [sorted(df.columns.levels[0]), df.columns.levels[1]],
+        [sorted(df.columns.levels[0]), sorted(df.columns.levels[1])],
         names=df.columns.names,
     )
 
@@ -81,7 +114,27 @@ def parse_probtest_fof(path):
     into two pandas DataFrames with the index reset and assigns them to df_report
     and df_obs respectively.
     """
-    ds = xr.open_dataset(path)
+    with open_feedback_dataset(path) as ds:
+        return fof_dataframes(ds)
+
+
+def parse_probtest_fof_observations(path, variables=("veri_data",)):
+    """
+    Read only the given observation variables of the feedback file at path,
+    sorted like the observations of parse_probtest_fof, into a DataFrame with
+    the index reset. Apart from them, only the variables needed for sorting
+    are read and nothing else is converted to pandas.
+    """
+    with open_feedback_dataset(path) as ds:
+        ds_obs = sort_observations(ds, list(variables))
+        return pd.DataFrame(ds_obs.to_dataframe().reset_index())
+
+
+def fof_dataframes(ds):
+    """
+    Split an opened feedback dataset according to split_feedback_dataset and
+    convert the reports and observations to DataFrames with the index reset.
+    """
     ds_report, ds_obs = split_feedback_dataset(ds)
     df_report, df_obs = (
         pd.DataFrame(d.to_dataframe().reset_index()) for d in (ds_report, ds_obs)
@@ -90,6 +143,66 @@ def parse_probtest_fof(path):
     return df_report, df_obs
 
 
+def parsed_nbytes(parsed):
+    """Memory of the output of a parser, which is a DataFrame or a tuple of them."""
+    if isinstance(parsed, tuple):
+        return sum(parsed_nbytes(p) for p in parsed)
+    return int(parsed.memory_usage(deep=True).sum())
+
+
+def enable_persistent_parse_cache(cache_dir, max_size_mb=DEFAULT_CACHE_MAX_SIZE_MB):
+    """
+    Keep snapshots of parsed reference and tolerance files in cache_dir across
+    invocations of probtest. Passing no cache_dir disables the cache.
+    """
+    global _persistent_parse_cache  # pylint: disable=global-statement
+    if cache_dir:
+        logger.info("using parse cache in %s", cache_dir)
+        _persistent_parse_cache = ParseCache(cache_dir, max_size_mb)
+    else:
+        _persistent_parse_cache = None
+
+
+def parse_cached(parse_function, path, persistent=False, **kwargs):
+    """
+    Memoize parse_function(path, **kwargs) within one process, meant for the
+    reference and tolerance files shared by several checks. The cache is keyed
+    by the path and the size and modification time of the file, so a file
+    which is rewritten in the meantime is parsed again. At most
+    PARSE_CACHE_MAX_BYTES of parsed data are kept, the least recently used
+    files are dropped first. The cached data is returned without a copy and
+    must not be modified in place by the callers.
+
+    If persistent is set and a persistent cache is enabled, the parsed data is
+    also read from or stored in that cache. This is meant for files which are
+    reused across invocations, like reference and tolerance files.
+    """
+    stat = os.stat(path)
+    key = (
+        parse_function,
+        os.path.abspath(path),
+        stat.st_size,
+        stat.st_mtime_ns,
+        stat.st_ctime_ns,
+        repr(sorted(kwargs.items())),
+    )
+
+    if key in _parse_cache:
+        _parse_cache.move_to_end(key)
+        return _parse_cache[key][0]
+
+    if persistent and _persistent_parse_cache is not None:
+        parsed = _persistent_parse_cache.load(parse_function, path, **kwargs)
+    else:
+        parsed = parse_function(path, **kwargs)
+
+    _parse_cache[key] = (parsed, parsed_nbytes(parsed))
+    while sum(nbytes for _, nbytes in _parse_cache.values()) > PARSE_CACHE_MAX_BYTES:
+        _parse_cache.popitem(last=False)
+
+    return parsed
+
+
 def read_input_file(label, file_name, specification):
     """Read input file file_name using the specification."""
     try:
@@ -311,18 +424,41 @@ def parse_check(
                                                 dict of DataFrames for fof files).
     """
     if input_file_ref.file_type == FileType.FOF:
-        df_tol = pd.read_csv(tolerance_file_name, index_col=0)
-        df_ref_rep, df_ref_obs = parse_probtest_fof(input_file_ref.path)
+        df_tol = parse_cached(
+            pd.read_csv, tolerance_file_name, persistent=True, index_col=0
+        )
+        if len(df_tol.columns) > 1:  # tolerances per group of observations
+            df_groups = parse_cached(
+                parse_probtest_fof_observations,
+                input_file_ref.path,
+                persistent=True,
+                variables=tuple(c for c in df_tol.columns if c != "veri_data"),
+            )
+            df_tol = expand_fof_tolerance(df_tol, df_groups.drop(columns="d_body"))
+        df_ref_rep, df_ref_obs = parse_cached(
+            parse_probtest_fof, input_file_ref.path, persistent=True
+        )
         df_cur_rep, df_cur_obs = parse_probtest_fof(input_file_cur.path)
 
         df_ref = {"reports": df_ref_rep, "observation": df_ref_obs}
         df_cur = {"reports": df_cur_rep, "observation": df_cur_obs}
     else:
-        df_tol = parse_probtest_stats(tolerance_file_name, index_col=[0, 1])
-        df_ref = parse_probtest_stats(input_file_ref.path, index_col=[0, 1, 2])
+        df_tol = parse_cached(
+            parse_probtest_stats,
+            tolerance_file_name,
+            persistent=True,
+            index_col=[0, 1],
+        )
+        df_ref = parse_cached(
+            parse_probtest_stats,
+            input_file_ref.path,
+            persistent=True,
+            index_col=[0, 1, 2],
+        )
         df_cur = parse_probtest_stats(input_file_cur.path, index_col=[0, 1, 2])
 
-    df_tol *= factor
+    # the cached tolerances are not modified in place
+    df_tol = df_tol * factor
 
     return df_tol, df_ref, df_cur
 
@@ -333,13 +469,23 @@ def check_file_with_tolerances(
     input_file_cur,
     factor,
     rules: Optional[dict[str, list[int]]] = None,
-):
+    fail_fast: bool = False,
+    summary_only: bool = False,
+    max_logged_differences: int = MAX_LOGGED_DIFFERENCES,
+):  # pylint: disable=too-many-positional-arguments
     """
     This function calculates the relative difference between the current file and
     the reference file, ensuring that the results fall within the limits specified
     in the tolerance file.
     For FOF-type files, it also performs an additional check on variables with multiple
     possible values to ensure that any variations remain within the allowed range.
+
+    With fail_fast, stats files are checked file_ID/variable block by block and the
+    check stops at the first block exceeding its tolerance; only this block is
+    returned as differences. With summary_only, only the result is computed and
+    empty DataFrames are returned for the differences and tolerances.
+    For FOF files, at most max_logged_differences differences per variable are
+    written in detail to the log file.
     """
     if rules is None:
         rules = {}
@@ -351,29 +497,18 @@ def check_file_with_tolerances(
         )
         sys.exit(1)
 
+    if files_identical(input_file_ref.path, input_file_cur.path):
+        logger.info(
+            "%s and %s are identical, skipping the comparison",
+            input_file_cur.path,
+            input_file_ref.path,
+        )
+        return True, pd.DataFrame(), pd.DataFrame()
+
     df_tol, df_ref, df_cur = parse_check(
         tolerance_file_name, input_file_ref, input_file_cur, factor
     )
 
-    if input_file_ref.file_type == FileType.FOF:
-        log_file_name = get_log_file_name(input_file_ref.path)
-        errors = check_multiple_solutions_from_dict(
-            df_ref, df_cur, rules, log_file_name
-        )
-
-        if errors:
-            logger.error("RESULT: check FAILED")
-            err = pd.DataFrame()
-            tol = pd.DataFrame()
-            return False, err, tol
-    else:
-        # check if variables are available in reference file
-        skip_test, df_ref, df_cur = check_intersection(df_ref, df_cur)
-
-        if skip_test:  # No intersection
-            logger.error("RESULT: check FAILED")
-            sys.exit(1)
-
     logger.info("applying a factor of %s to the spread", factor)
     logger.info(
         "checking %s against %s using tolerances from %s",
@@ -382,11 +517,178 @@ def check_file_with_tolerances(
         tolerance_file_name,
     )
 
-    if input_file_ref.file_type == FileType.FOF:
-        df_ref = df_ref["observation"]["veri_data"]
-        df_cur = df_cur["observation"]["veri_data"]
-        df_tol.columns = ["veri_data"]
+    if input_file_ref.file_type == FileType.STATS:
+        return check_stats_with_tolerances(
+            df_tol, df_ref, df_cur, fail_fast=fail_fast, summary_only=summary_only
+        )
+
+    df_tol.columns = ["veri_data"]
+
+    return check_fof_with_tolerances(
+        df_tol,
+        df_ref,
+        df_cur,
+        rules,
+        get_log_file_name(input_file_ref.path),
+        max_logged_differences=max_logged_differences,
+        summary_only=summary_only,
+    )
+
+
+def check_fof_with_tolerances(
+    df_tol,
+    df_ref,
+    df_cur,
+    rules: dict[str, list[int]],
+    log_file_name,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+    summary_only=False,
+    identical_variables=frozenset(),
+):  # pylint: disable=too-many-positional-arguments
+    """
+    Check parsed fof files, given as dictionaries of DataFrames like in
+    parse_check, against the rules and the tolerances of the veri data,
+    see check_file_with_tolerances. The variables in identical_variables are
+    known to be identical in both files and are not compared.
+    """
+    errors = check_multiple_solutions_from_dict(
+        df_ref,
+        df_cur,
+        rules,
+        log_file_name,
+        max_logged_differences,
+        identical_variables,
+    )
+
+    if errors:
+        logger.error("RESULT: check FAILED")
+        err = pd.DataFrame()
+        tol = pd.DataFrame()
+        return False, err, tol
+
+    df_ref = df_ref["observation"]["veri_data"]
+    df_cur = df_cur["observation"]["veri_data"]
+
+    return compare_with_tolerances(
+        df_ref, df_cur, df_tol, FileType.FOF, summary_only=summary_only
+    )
+
+
+def fof_tolerance_dataframe(tolerance, df_obs):
+    """
+    Build the tolerance DataFrame of the veri data of the observations df_obs.
+    tolerance is either a scalar applied to all observations or a dictionary
+    with the tolerance per observed variable (varno); the veri data of
+    variables missing in the dictionary must be equal.
+    """
+    if isinstance(tolerance, dict):
+        values = df_obs["varno"].map(tolerance).fillna(0.0).to_numpy(dtype=float)
+    else:
+        values = np.full(len(df_obs), float(tolerance))
+    return pd.DataFrame({"veri_data": values}, index=df_obs.index)
+
+
+def check_fof_datasets_with_tolerances(
+    ds_ref,
+    ds_cur,
+    tolerance,
+    log_file_name,
+    rules: Optional[dict[str, list[int]]] = None,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+    summary_only=False,
+    identical_variables=frozenset(),
+    chunk_size=COMPARE_CHUNK_SIZE,
+):  # pylint: disable=too-many-positional-arguments
+    """
+    Check two already opened fof datasets against the rules and a scalar or
+    per variable tolerance of the veri data, see fof_tolerance_dataframe, like
+    check_fof_with_tolerances checks the DataFrames of fof_dataframes. No
+    tolerance file is needed. Differences are written to log_file_name.
+
+    The datasets are not converted to DataFrames. Only the sort keys, the
+    variables with rules and the veri data are read as a whole, all other
+    variables are compared in sorted order block by block of chunk_size rows,
+    see compare_sorted_columns, so lazily opened files are never fully loaded.
+
+    identical_variables lists variables known to be identical in both
+    datasets, e.g. from util.checksum.identical_variables. They are neither
+    read nor compared if all the variables the datasets are sorted by are
+    identical, as the rows would otherwise not be in the same order.
+    """
+    sort_variables = {"l_body", *REPORT_SORT_KEYS, *OBSERVATION_SORT_KEYS}
+    if not sort_variables <= set(identical_variables):
+        identical_variables = frozenset()
+
+    columns_ref = sorted_feedback_columns(ds_ref, feedback_sort_orders(ds_ref))
+    columns_cur = sorted_feedback_columns(ds_cur, feedback_sort_orders(ds_cur))
+
+    detailed_logger = initialize_detailed_logger(
+        get_detailed_logger_name(log_file_name),
+        log_level="DEBUG",
+        log_file=log_file_name,
+    )
+    try:
+        errors = compare_sorted_columns_with_rules(
+            columns_ref,
+            columns_cur,
+            rules or {},
+            detailed_logger,
+            max_logged_differences,
+            identical_variables,
+            chunk_size,
+        )
+    finally:
+        close_detailed_logger(detailed_logger)
+    clean_logger_file_if_only_details(log_file_name)
+
+    if errors:
+        logger.error("RESULT: check FAILED")
+        return False, pd.DataFrame(), pd.DataFrame()
 
+    obs_ref, obs_cur = columns_ref["observation"], columns_cur["observation"]
+    df_tol = fof_tolerance_dataframe(
+        tolerance, pd.DataFrame({"varno": sorted_column_values(obs_ref["varno"])})
+    )
+    return compare_with_tolerances(
+        pd.Series(sorted_column_values(obs_ref["veri_data"]), name="veri_data"),
+        pd.Series(sorted_column_values(obs_cur["veri_data"]), name="veri_data"),
+        df_tol,
+        FileType.FOF,
+        summary_only=summary_only,
+    )
+
+
+def check_stats_with_tolerances(
+    df_tol, df_ref, df_cur, fail_fast=False, summary_only=False
+):
+    """
+    Check parsed stats DataFrames against the tolerances, see
+    check_file_with_tolerances. The current DataFrame may also come directly
+    from df_from_file_ids instead of a stats file.
+    """
+    # check if variables are available in reference file
+    skip_test, df_ref, df_cur = check_intersection(df_ref, df_cur)
+
+    if skip_test:  # No intersection
+        logger.error("RESULT: check FAILED")
+        sys.exit(1)
+
+    if fail_fast:
+        out, err, tol = check_variable_blocks(df_ref, df_cur, df_tol)
+        if summary_only:
+            return out, pd.DataFrame(), pd.DataFrame()
+        return out, err, tol
+
+    return compare_with_tolerances(
+        df_ref, df_cur, df_tol, FileType.STATS, summary_only=summary_only
+    )
+
+
+def compare_with_tolerances(df_ref, df_cur, df_tol, file_type, summary_only=False):
+    """
+    Compute the relative difference between the reference and the current data
+    and compare it with the tolerances.
+    """
     # compute relative difference
     diff_df = compute_rel_diff_dataframe(df_ref, df_cur)
 
@@ -400,17 +702,148 @@ def check_file_with_tolerances(
     diff_df = diff_df.mask(only_one_nan, np.inf)
 
     # if stats, take maximum over height
-    if input_file_ref.file_type == FileType.STATS:
+    if file_type == FileType.STATS:
         diff_df = diff_df.groupby(["file_ID", "variable"]).max()
 
-    if input_file_ref.file_type == FileType.FOF:
+    if file_type == FileType.FOF:
         diff_df = diff_df.to_frame()
 
+    if summary_only:
+        out = not ((diff_df - df_tol) > CHECK_THRESHOLD).any(axis=None)
+        return out, pd.DataFrame(), pd.DataFrame()
+
     out, err, tol = check_variable(diff_df, df_tol)
 
     return out, err, tol
 
 
+def check_variable_blocks(df_ref, df_cur, df_tol):
+    """
+    Compare stats DataFrames one file_ID/variable block at a time and stop at the
+    first block exceeding its tolerance. Equivalent to computing the relative
+    difference of the whole DataFrames, taking the maximum over height and calling
+    check_variable, but cheaper if the check fails early.
+    Returns the result and the difference and tolerance of the failing block.
+    """
+    df_cur = df_cur.reindex(index=df_ref.index, columns=df_ref.columns)
+    ref_values = df_ref.to_numpy()
+    cur_values = df_cur.to_numpy()
+
+    blocks = df_ref.groupby(["file_ID", "variable"]).indices
+    keys = pd.MultiIndex.from_tuples(list(blocks), names=["file_ID", "variable"])
+    tol_values = df_tol.reindex(index=keys, columns=df_ref.columns).to_numpy()
+
+    for i, rows in enumerate(blocks.values()):
+        ref = ref_values[rows]
+        cur = cur_values[rows]
+        diff = np.abs(ref - cur) / (1.0 + np.abs(ref))
+        # see check_file_with_tolerances for the handling of missing values
+        diff[np.isnan(ref) ^ np.isnan(cur)] = np.inf
+        # maximum over height, ignoring NaN like DataFrame.max
+        diff_max = np.fmax.reduce(diff, axis=0)
+
+        if np.any(diff_max - tol_values[i] > CHECK_THRESHOLD):
+            err = pd.DataFrame(
+                [diff_max], index=keys[i : i + 1], columns=df_ref.columns
+            )
+            tol = pd.DataFrame(
+                [tol_values[i]], index=keys[i : i + 1], columns=df_ref.columns
+            )
+            return False, err, tol
+
+    return True, pd.DataFrame(), pd.DataFrame()
+
+
+def check_stats_files_with_tolerances(
+    tolerance_file_name,
+    input_file_ref,
+    input_files_cur,
+    factor,
+):
+    """
+    Batched version of check_file_with_tolerances for stats files sharing the
+    same reference and tolerance file (e.g. the members of an ensemble).
+
+    The reference and tolerance files are parsed only once. All current files
+    are stacked along a leading "member" index level and compared in a single
+    vectorized pass. Nothing is logged per file and the logging configuration
+    is left untouched.
+
+    Returns:
+        tuple: A tuple containing two lists, aligned with input_files_cur:
+            - passed (list[bool]): Whether the file is within tolerance.
+            - failed_variables (list[list[str]]): Names of the variables
+                                                  exceeding their tolerance.
+    """
+    if input_file_ref.file_type != FileType.STATS or any(
+        info.file_type != FileType.STATS for info in input_files_cur
+    ):
+        logger.critical("Batched checks are only supported for stats files. Abort.")
+        sys.exit(1)
+
+    if not input_files_cur:
+        return [], []
+
+    df_tol = parse_probtest_stats(tolerance_file_name, index_col=[0, 1]) * factor
+    df_ref = parse_probtest_stats(input_file_ref.path, index_col=[0, 1, 2])
+    dfs_cur = [
+        parse_probtest_stats(info.path, index_col=[0, 1, 2]) for info in input_files_cur
+    ]
+
+    # only the time steps common to the reference and each file are tested
+    # (see check_intersection), shorter files are padded and masked below
+    ncols = min(len(df_ref.columns), max(len(df.columns) for df in dfs_cur))
+    columns = df_ref.columns[:ncols]
+    member_ncols = np.array([min(len(df.columns), ncols) for df in dfs_cur])
+    df_cur = pd.concat(
+        [
+            df.iloc[:, :n].set_axis(columns[:n], axis=1).reindex(columns=columns)
+            for df, n in zip(dfs_cur, member_ncols)
+        ],
+        keys=range(len(dfs_cur)),
+        names=["member"],
+    )
+
+    # only variables available in the reference are tested
+    cur_index = df_cur.index.droplevel("member")
+    common = cur_index.isin(df_ref.index)
+    df_cur = df_cur[common]
+    cur_index = cur_index[common]
+
+    members_with_data = set(df_cur.index.get_level_values("member"))
+    if len(members_with_data) != len(dfs_cur):
+        logger.error("No intersection between variables in input and reference file.")
+        logger.error("RESULT: check FAILED")
+        sys.exit(1)
+
+    ref_values = df_ref.iloc[:, :ncols].reindex(cur_index).to_numpy()
+    cur_values = df_cur.to_numpy()
+
+    diff = np.abs(ref_values - cur_values) / (1.0 + np.abs(ref_values))
+    # see check_file_with_tolerances for the handling of missing values
+    diff[np.isnan(ref_values) ^ np.isnan(cur_values)] = np.inf
+    row_ncols = member_ncols[df_cur.index.get_level_values("member")]
+    diff[np.arange(ncols) >= row_ncols[:, np.newaxis]] = 0.0
+
+    diff_df = pd.DataFrame(diff, index=df_cur.index, columns=columns)
+    diff_df = diff_df.groupby(["member", "file_ID", "variable"]).max()
+
+    tol_values = df_tol.reindex(
+        index=diff_df.index.droplevel("member"), columns=columns
+    ).to_numpy()
+    selector = ((diff_df.to_numpy() - tol_values) > CHECK_THRESHOLD).any(axis=1)
+
+    failed_index = diff_df.index[selector]
+    failed_variables: list[list[str]] = [[] for _ in dfs_cur]
+    for member, _, variable in failed_index:
+        if variable not in failed_variables[member]:
+            failed_variables[member].append(variable)
+
+    passed = [not variables for variables in failed_variables]
+
+    return passed, failed_variables
+
+
 def has_enough_data(dfs):
     ndata = len(dfs)
     if ndata < 1:
@@ -420,83 +853,94 @@ def has_enough_data(dfs):
         sys.exit(1)
 
 
+def fof_tolerance(df_ref, dfs, minimum_tolerance):
+    """
+    Compute the tolerance of the veri data of fof files as the maximum relative
+    difference between the reference and the members, at least
+    minimum_tolerance. The maximum is kept in a single vector updated member by
+    member, so dfs may be a generator reading the members one at a time.
+    """
+    index, tolerance = None, None
+    for df in dfs:
+        rdiff = compute_rel_diff_dataframe(df_ref, df)
+        if tolerance is None:
+            index, tolerance = rdiff.index, rdiff.to_numpy(np.float64, copy=True)
+            continue
+
+        if not rdiff.index.equals(index):
+            union = index.union(rdiff.index)
+            tolerance = pd.Series(tolerance, index=index).reindex(union).to_numpy()
+            index, rdiff = union, rdiff.reindex(union)
+
+        # like DataFrame.max, NaN is ignored unless all members are NaN
+        np.fmax(tolerance, rdiff.to_numpy(np.float64), out=tolerance)
+
+    tolerance[tolerance < minimum_tolerance] = minimum_tolerance
+    return pd.Series(tolerance, index=index)
+
+
 file_name_parser = {
-    FileType.FOF: lambda path: parse_probtest_fof(path)[1],
+    FileType.FOF: parse_probtest_fof_observations,
     FileType.STATS: parse_probtest_stats,
 }
 
 
-def compare_cells_rules(
-    ref_df, cur_df, cols, rules: dict[str, list[int]], detailed_logger
-):
-    """
-    This function compares two DataFrames cell by cell for a selected set of columns.
-    For each row and column, it ignores values that are equal or whose differences
-    are allowed by predefined rules.
-    All other differences not admitted are stored in a log file.
-    """
-    errors = False
-    for row_idx, (row1, row2) in enumerate(
-        zip(ref_df.itertuples(), cur_df.itertuples())
-    ):
-        for col in cols:
-            val1 = getattr(row1, col)
-            val2 = getattr(row2, col)
-
-            if val1 == val2:
-                continue
-
-            allowed = rules.get(col, [])
-            if val1 in allowed and val2 in allowed:
-                continue
-
-            detailed_logger.info(
-                "Values different and not admitted | "
-                "row=%s, column=%s, file1=%s, file2=%s",
-                row_idx,
-                col,
-                val1,
-                val2,
-            )
-            errors = True
-    return errors
-
-
 def check_multiple_solutions_from_dict(
-    dict_ref, dict_cur, rules: dict[str, list[int]], log_file_name
-):
+    dict_ref,
+    dict_cur,
+    rules: dict[str, list[int]],
+    log_file_name,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+    identical_variables=frozenset(),
+):  # pylint: disable=too-many-positional-arguments
     """
     This function compares two Python dictionaries, each containing DataFrames under
     the keys "reports" and "observation", row by row and column by column, according
     to rules defined in a separate dictionary. If the variable does not need to follow
     specific rules, the values must be identical.
-    It records the row, column and invalid values in a log file.
+    It records the row, column and invalid values in a log file, at most
+    max_logged_differences of them per variable. The columns listed in
+    identical_variables are known to be identical and are not compared.
     """
 
-    errors = False
     detailed_logger = initialize_detailed_logger(
-        "DETAILS", log_level="DEBUG", log_file=log_file_name
+        get_detailed_logger_name(log_file_name),
+        log_level="DEBUG",
+        log_file=log_file_name,
     )
+    try:
+        errors = compare_dataframes_with_rules(
+            dict_ref,
+            dict_cur,
+            rules,
+            detailed_logger,
+            max_logged_differences,
+            identical_variables,
+        )
+    finally:
+        close_detailed_logger(detailed_logger)
 
-    for key, ref_df in dict_ref.items():
-        cur_df = dict_cur[key]
-        common_cols = [col for col in ref_df.columns if col in cur_df.columns]
-
-        cols_with_rules = [col for col in common_cols if col in rules]
-        cols_without_rules = [col for col in common_cols if col not in rules]
-
-        if cols_without_rules:
-            t, e = compare_var_and_attr_ds(
-                ref_df[list(cols_without_rules)].to_xarray(),
-                cur_df[list(cols_without_rules)].to_xarray(),
-                detailed_logger,
-            )
-            if t != e:
-                return True
-
-        if cols_with_rules:
-            errors = compare_cells_rules(
-                ref_df, cur_df, cols_with_rules, rules, detailed_logger
-            )
     clean_logger_file_if_only_details(log_file_name)
     return errors
+
+
+def compare_dataframes_with_rules(
+    dict_ref,
+    dict_cur,
+    rules: dict[str, list[int]],
+    detailed_logger,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+    identical_variables=frozenset(),
+):  # pylint: disable=too-many-positional-arguments
+    """
+    Compare the DataFrames of check_multiple_solutions_from_dict, writing the
+    differences to detailed_logger, see compare_sorted_columns_with_rules.
+    """
+    return compare_sorted_columns_with_rules(
+        {key: dataframe_columns(df) for key, df in dict_ref.items()},
+        {key: dataframe_columns(df) for key, df in dict_cur.items()},
+        rules,
+        detailed_logger,
+        max_logged_differences,
+        identical_variables,
+    )
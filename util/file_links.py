@@ -0,0 +1,62 @@
+"""
+This module provides a function to place a file in another directory by
+linking instead of copying it, falling back to a copy where linking is not
+possible.
+"""
+
+import fcntl
+import os
+import shutil
+
+from util.log_handler import logger
+
+LINK_MODES = ("copy", "hardlink", "reflink", "symlink")
+
+# ioctl request of Linux to share the extents of one file with another one
+_FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    """
+    Create dst as a copy-on-write clone of src. Raises OSError if the file
+    system does not support it.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copymode(src, dst)
+
+
+def link_file(src, dst_dir, mode="copy"):
+    """
+    Place the file src in the directory dst_dir according to mode, one of
+    LINK_MODES. If the file cannot be linked, e.g. across file systems or on
+    file systems without reflink support, it is copied instead. An existing
+    file of the same name in dst_dir is replaced, never written through, as it
+    may itself be a link to src. Raises shutil.SameFileError, like shutil.copy,
+    if dst is src itself, which would otherwise be removed.
+    """
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    if os.path.realpath(src) == os.path.realpath(dst):
+        raise shutil.SameFileError(f"{src} and {dst} are the same file")
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    try:
+        if mode == "hardlink":
+            os.link(src, dst)
+            return dst
+        if mode == "reflink":
+            reflink(src, dst)
+            return dst
+        if mode == "symlink":
+            os.symlink(os.path.abspath(src), dst)
+            return dst
+    except OSError as e:
+        logger.info("could not %s %s, copying it instead: %s", mode, src, e)
+
+    return shutil.copy(src, dst)
@@ -3,6 +3,7 @@ This module contains functions for handling fof files
 """
 
 import os
+import struct
 
 import numpy as np
 import pandas as pd
@@ -10,6 +11,140 @@ import xarray as xr
 
 from util.log_handler import logger
 
+# number of differences per variable written in detail to the log
+MAX_LOGGED_DIFFERENCES = 100
+# number of differing rows formatted and written to the log at once
+LOG_BATCH_SIZE = 50
+# number of rows (along d_hdr or d_body) compared at once
+COMPARE_CHUNK_SIZE = 1 << 20
+
+# variables by which split_feedback_dataset sorts the reports and observations
+REPORT_SORT_KEYS = ["lat", "lon", "statid", "time_nomi", "codetype"]
+OBSERVATION_SORT_KEYS = ["lat", "lon", "statid", "varno", "level", "time_nomi"]
+# report variables which are repeated for each observation of the report
+EXPANDED_REPORT_VARIABLES = ["lat", "lon", "statid", "time_nomi"]
+# variables which are not compared by compare_var_and_attr_ds and
+# compare_sorted_columns
+UNCOMPARED_VARIABLES = ["source", "i_body", "l_body", "veri_data", "record"]
+
+
+# big-endian dtypes of the netCDF classic external data types
+_CLASSIC_NC_TYPES = {1: ">i1", 2: "S1", 3: ">i2", 4: ">i4", 5: ">f4", 6: ">f8"}
+_CLASSIC_ABSENT, _CLASSIC_DIMENSION, _CLASSIC_VARIABLE, _CLASSIC_ATTRIBUTE = (
+    0,
+    10,
+    11,
+    12,
+)
+
+
+class _ClassicHeader:
+    """Parser of the header of a netCDF classic (CDF-1) or 64-bit offset file."""
+
+    def __init__(self, buffer, version):
+        self.buffer = buffer
+        self.pos = 8  # magic and number of records
+        self.offset_format = ">i" if version == 1 else ">q"
+
+    def read(self, fmt):
+        values = struct.unpack_from(fmt, self.buffer, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values[0] if len(values) == 1 else values
+
+    def read_name(self):
+        length = self.read(">i")
+        name = bytes(self.buffer[self.pos : self.pos + length]).decode("utf-8")
+        self.pos += -(-length // 4) * 4
+        return name
+
+    def read_list(self, tag, read_element):
+        list_tag, n_elements = self.read(">ii")
+        if list_tag not in (tag, _CLASSIC_ABSENT):
+            raise ValueError(f"invalid netCDF classic header at byte {self.pos}")
+        return dict(read_element() for _ in range(n_elements))
+
+    def read_attribute(self):
+        name = self.read_name()
+        nc_type, n_values = self.read(">ii")
+        dtype = np.dtype(_CLASSIC_NC_TYPES[nc_type])
+        size = dtype.itemsize * n_values
+        raw = bytes(self.buffer[self.pos : self.pos + size])
+        self.pos += -(-size // 4) * 4
+        if nc_type == 2:
+            return name, raw.decode("utf-8", errors="replace")
+        values = np.frombuffer(raw, dtype=dtype).astype(dtype.newbyteorder("="))
+        return name, values[0] if n_values == 1 else values
+
+    def read_dimension(self):
+        return self.read_name(), self.read(">i")
+
+    def read_variable(self):
+        name = self.read_name()
+        n_dims = self.read(">i")
+        dimids = [self.read(">i") for _ in range(n_dims)]
+        attrs = self.read_list(_CLASSIC_ATTRIBUTE, self.read_attribute)
+        nc_type, _ = self.read(">ii")  # type and padded size of the variable
+        begin = self.read(self.offset_format)
+        return name, (dimids, attrs, _CLASSIC_NC_TYPES[nc_type], begin)
+
+
+def read_classic_netcdf(path):
+    """
+    Memory-map a netCDF classic or 64-bit offset file and return its
+    dimensions, global attributes and variables, each variable as a tuple of
+    its dimension names, a read-only zero-copy NumPy view of its (big-endian)
+    data and its attributes. Record variables, whose data are interleaved
+    along the unlimited dimension, are left out.
+    Returns None if the file is not in one of these formats, e.g. HDF5.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic not in (b"CDF\x01", b"CDF\x02"):
+        return None
+
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    header = _ClassicHeader(data, magic[3])
+    dims = header.read_list(_CLASSIC_DIMENSION, header.read_dimension)
+    attrs = header.read_list(_CLASSIC_ATTRIBUTE, header.read_attribute)
+    variables_header = header.read_list(_CLASSIC_VARIABLE, header.read_variable)
+
+    dim_names = list(dims)
+    variables = {}
+    for name, (dimids, var_attrs, dtype, begin) in variables_header.items():
+        var_dims = tuple(dim_names[i] for i in dimids)
+        if any(dims[d] == 0 for d in var_dims):  # record variable
+            continue
+        shape = tuple(dims[d] for d in var_dims)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        view = data[begin : begin + size].view(dtype).reshape(shape)
+        variables[name] = (var_dims, view, var_attrs)
+
+    return dims, attrs, variables
+
+
+def open_feedback_dataset(path):
+    """
+    Open a feedback file like xr.open_dataset. Files in netCDF classic format
+    are memory-mapped with read_classic_netcdf instead of being read through
+    the netCDF library, so that the data are shared via the page cache when the
+    same file is compared several times. Other files, e.g. HDF5 based netCDF-4
+    files or classic files with record variables, are opened with
+    xr.open_dataset.
+    """
+    classic = read_classic_netcdf(path)
+    if classic is None:
+        return xr.open_dataset(path)
+
+    dims, attrs, variables = classic
+    if any(length == 0 for length in dims.values()):
+        return xr.open_dataset(path)
+
+    ds = xr.Dataset(
+        {name: xr.Variable(*variable) for name, variable in variables.items()},
+        attrs=attrs,
+    )
+    return xr.decode_cf(ds)
+
 
 def get_report_variables(ds):
     """
@@ -39,35 +174,174 @@ def get_observation_variables(ds):
     return vars_shape_observation
 
 
+def lexsort_keys(values):
+    """
+    Return the key(s) to sort values with np.lexsort, most significant first.
+    Byte and unicode strings are encoded to fixed-width unsigned integers
+    (big-endian 8-byte chunks and code points respectively), which sort in
+    the same order as the strings.
+    """
+    if values.dtype.kind == "O":
+        values = np.array(values.tolist())
+
+    if values.dtype.kind == "S":
+        width = values.dtype.itemsize
+        n_chunks = -(-width // 8)
+        padded = np.zeros((values.size, n_chunks * 8), dtype=np.uint8)
+        padded[:, :width] = values.view(np.uint8).reshape(values.size, width)
+        encoded = padded.view(">u8")
+        return [encoded[:, i] for i in range(n_chunks)]
+
+    if values.dtype.kind == "U":
+        n_chars = values.dtype.itemsize // 4
+        encoded = values.view(np.uint32).reshape(values.size, n_chars)
+        return [encoded[:, i] for i in range(n_chars)]
+
+    return [values]
+
+
+def lexsort_permutation(key_arrays):
+    """
+    Compute the permutation sorting by the given key arrays, the first key
+    being the most significant one. Like xarray's sortby, the sort is stable.
+    """
+    keys = [key for values in key_arrays for key in lexsort_keys(np.asarray(values))]
+    return np.lexsort(keys[::-1])
+
+
+def feedback_sort_orders(ds):
+    """
+    Compute the orders of split_feedback_dataset with np.lexsort: the sorted
+    positions of the reports and of the observations, and the report of each
+    sorted observation. Only the sort keys and l_body are read.
+    """
+    hdr_perm = lexsort_permutation([ds[key].values for key in REPORT_SORT_KEYS])
+
+    lbody = ds["l_body"].values.astype(int)
+    hdr_of_body = np.repeat(np.arange(lbody.size), lbody)
+    expanded = [s for s in EXPANDED_REPORT_VARIABLES if s in ds]
+
+    def body_values(varname):
+        values = ds[varname].values
+        return values[hdr_of_body] if varname in expanded else values
+
+    body_perm = lexsort_permutation([body_values(key) for key in OBSERVATION_SORT_KEYS])
+
+    return hdr_perm, body_perm, hdr_of_body[body_perm]
+
+
+def observation_variables(ds):
+    """
+    Names of the variables of the observations of split_feedback_dataset,
+    without veri_data if it is not an observation variable.
+    """
+    expanded = [s for s in EXPANDED_REPORT_VARIABLES if s in ds]
+    n_body = ds.attrs["n_body"]
+    return [
+        var for var in ds.data_vars if var in expanded or ds[var].shape[0] == n_body
+    ]
+
+
 def split_feedback_dataset(ds):
     """
     Split feedback file according to reports and observations dimensions,
     expand lat, lon, statid and time_nomi according to l_body
     and sort them to assure unique order.
+
+    The sort order is computed once per dimension with np.lexsort and applied
+    to all variables with a single gather, see sort_observations for the
+    observations.
     """
-    report_variables = get_report_variables(ds)
-    ds_reports = ds[report_variables]
+    orders = feedback_sort_orders(ds)
+
+    hdr_dim = ds["lat"].dims[0]
+    ds_report_sorted = ds[get_report_variables(ds)].isel({hdr_dim: orders[0]})
+
+    variables = observation_variables(ds)
+    if "veri_data" not in variables:
+        variables.append("veri_data")
+
+    return ds_report_sorted, sort_observations(ds, variables, orders)
+
+
+def sort_observations(ds, variables, orders=None):
+    """
+    Return the given observation variables of a feedback dataset in the order
+    of split_feedback_dataset, with lat, lon, statid and time_nomi, as well as
+    any other requested report variable, expanded according to l_body. Only
+    the requested variables and the sort keys are read, so this can be used to
+    load a subset of a lazily opened file. orders are the sort orders of
+    feedback_sort_orders, computed if not given.
+
+    The header variables are expanded to the observations by indexing with the
+    sorted header index of each observation instead of repeating them first.
+    """
+    _, body_perm, hdr_of_body_sorted = orders or feedback_sort_orders(ds)
+
+    body_dim = ds["varno"].dims[0]
+    expanded_variables = [v for v in variables if is_expanded_variable(ds, v)]
+
+    ds_obs = ds[[v for v in variables if v not in expanded_variables]]
+    ds_obs_sorted = ds_obs.isel({body_dim: body_perm}).assign(
+        {
+            varname: xr.Variable(
+                body_dim,
+                ds[varname].values[hdr_of_body_sorted],
+                attrs=ds[varname].attrs,
+            )
+            for varname in expanded_variables
+        }
+    )
 
-    sort_keys_reports = ["lat", "lon", "statid", "time_nomi", "codetype"]
-    ds_report_sorted = ds_reports.sortby(sort_keys_reports)
+    return ds_obs_sorted[variables]
 
-    lbody = ds["l_body"].values
 
-    for varname in filter(lambda s: s in ["lat", "lon", "statid", "time_nomi"], ds):
-        values = np.repeat(ds[varname], lbody.astype(int))
-        attrs = ds[varname].attrs
-        ds = ds.assign({varname: xr.Variable("d_body", values, attrs=attrs)})
+def is_expanded_variable(ds, var):
+    """Whether the report variable var is repeated for each observation."""
+    return var in EXPANDED_REPORT_VARIABLES or ds[var].dims == ds["l_body"].dims
 
-    ds = ds.assign_coords(dict(zip(ds.coords, [ds[coord] for coord in ds.coords])))
 
-    observation_variables = get_observation_variables(ds)
-    observation_variables.append("veri_data")
+def sorted_feedback_columns(ds, orders):
+    """
+    Map the columns of the reports and observations of fof_dataframes to the
+    variable of ds they are taken from and the order of its rows, given by
+    feedback_sort_orders, without reading any data. The first column of each
+    is the dimension, like in DataFrame.reset_index.
+    """
+    hdr_perm, body_perm, hdr_of_body_sorted = orders
+    hdr_dim = ds["lat"].dims[0]
+    body_dim = ds["varno"].dims[0]
+
+    reports = {hdr_dim: (ds[hdr_dim].variable, hdr_perm)}
+    reports.update({v: (ds[v].variable, hdr_perm) for v in get_report_variables(ds)})
+
+    observation = {body_dim: (ds[body_dim].variable, body_perm)}
+    variables = observation_variables(ds)
+    if "veri_data" not in variables:
+        variables.append("veri_data")
+    observation.update(
+        {
+            v: (
+                ds[v].variable,
+                hdr_of_body_sorted if is_expanded_variable(ds, v) else body_perm,
+            )
+            for v in variables
+        }
+    )
+
+    return {"reports": reports, "observation": observation}
 
-    ds_obs = ds[observation_variables]
-    sort_keys_obs = ["lat", "lon", "statid", "varno", "level", "time_nomi"]
-    ds_obs_sorted = ds_obs.sortby(sort_keys_obs)
 
-    return ds_report_sorted, ds_obs_sorted
+def dataframe_columns(df):
+    """The columns of a DataFrame in the layout of sorted_feedback_columns."""
+    order = np.arange(len(df))
+    return {col: (xr.Variable("index", df[col].to_numpy()), order) for col in df}
+
+
+def sorted_column_values(column, rows=slice(None)):
+    """Read the given rows of a column of sorted_feedback_columns."""
+    variable, order = column
+    return variable[order[rows]].values
 
 
 def compare_arrays(arr1, arr2, var_name):
@@ -104,6 +378,52 @@ def compare_arrays(arr1, arr2, var_name):
     return total, equal, diff
 
 
+def compare_arrays_chunked(
+    var1, var2, var_name, chunk_size, max_diff_indices, orders=None
+):  # pylint: disable=too-many-positional-arguments
+    """
+    Comparison of two DataArrays of the same shape like compare_arrays, block by
+    block of chunk_size rows along the first dimension, so that only one block
+    of each array is read and converted at a time. With orders, a pair of
+    index arrays, the rows are compared in these orders instead, e.g. the
+    sorted rows of sorted_feedback_columns. Only the first max_diff_indices
+    indices of differing values are kept.
+    """
+    n_rows = var1.shape[0] if orders is None else orders[0].size
+    row_size = int(np.prod(var1.shape[1:]))
+    total = n_rows * row_size
+
+    def block(var, order, rows):
+        return (var[rows] if order is None else var[order[rows]]).values
+
+    order1, order2 = orders or (None, None)
+    equal = 0
+    diff = []
+    n_diff_kept = 0
+    for start in range(0, n_rows, chunk_size):
+        rows = slice(start, start + chunk_size)
+        arr1 = replace_nan_with_sentinel_float64(block(var1, order1, rows))
+        arr2 = replace_nan_with_sentinel_float64(block(var2, order2, rows))
+        mask_equal = (arr1 == arr2).ravel()
+        equal += int(mask_equal.sum())
+
+        if n_diff_kept < max_diff_indices and not mask_equal.all():
+            indices = np.where(~mask_equal)[0][: max_diff_indices - n_diff_kept]
+            diff.append(indices + start * row_size)
+            n_diff_kept += indices.size
+
+    if equal != total:
+        logger.info(
+            "Differences in '%s': %.2f%% equal. %s total entries for this variable",
+            var_name,
+            (equal / total) * 100,
+            total,
+        )
+
+    diff = np.concatenate(diff) if diff else np.array([], dtype=int)
+    return total, equal, diff
+
+
 def replace_nan_with_sentinel_float64(arr):
     """
     If the input array has a floating dtype, it is cast to float64
@@ -128,35 +448,78 @@ def clean_value(x):
     return str(x).rstrip(" '")
 
 
-def write_lines_log(ds1, ds2, diff, detailed_logger):
+def diff_rows_dataframe(ds, indices):
+    """
+    Convert only the rows at the given indices of the dataset to a DataFrame,
+    laid out like ds.to_dataframe().reset_index().
+    Datasets with more than one dimension are converted as a whole.
+    """
+    if len(ds.dims) != 1:
+        return ds.to_dataframe().reset_index().iloc[indices]
+
+    dim = next(iter(ds.dims))
+    if dim not in ds.indexes:
+        ds = ds.assign_coords({dim: np.arange(ds.sizes[dim])})
+    return ds.isel({dim: indices}).to_dataframe().reset_index()
+
+
+def write_lines_log(
+    ds1,
+    ds2,
+    diff,
+    detailed_logger,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+    n_diff=None,
+):  # pylint: disable=too-many-positional-arguments
     """
     This function writes the differences detected between
     two files to a detailed log file.
+    Only the first max_logged_differences differing rows are converted and
+    written, in batches of LOG_BATCH_SIZE rows, followed by the number of
+    rows left out. n_diff is the total number of differing rows, if diff
+    only holds the first ones.
     """
+    if n_diff is None:
+        n_diff = diff.size
 
-    da1 = ds1.to_dataframe().reset_index()
-    da2 = ds2.to_dataframe().reset_index()
+    logged = diff[:max_logged_differences]
+    da1 = diff_rows_dataframe(ds1, logged)
+    da2 = diff_rows_dataframe(ds2, logged)
     col_width = 13
     index = "|".join(f"{str(x):<{col_width}}" for x in da1.columns)
 
-    for i in diff:
-        row1 = "|".join(f"{clean_value(x):<{col_width}}" for x in da1.loc[i])
-        row2 = "|".join(f"{clean_value(x):<{col_width}}" for x in da2.loc[i])
-
-        diff_vals = []
-        for x, y in zip(da1.loc[i], da2.loc[i]):
-            if pd.api.types.is_number(x) and pd.api.types.is_number(y):
-                diff_vals.append(x - y)
-            else:
-                diff_vals.append("nan")
-
-        row_diff = "|".join(f"{str(x):<{col_width}}" for x in diff_vals)
-
-        detailed_logger.info("id  : %s", index)
-        detailed_logger.info("ref  : %s", row1)
-        detailed_logger.info("cur  : %s", row2)
-        detailed_logger.info("diff : %s", row_diff)
-        detailed_logger.info("")
+    for start in range(0, len(logged), LOG_BATCH_SIZE):
+        lines = []
+        for i in range(start, min(start + LOG_BATCH_SIZE, len(logged))):
+            values1 = da1.iloc[i]
+            values2 = da2.iloc[i]
+            row1 = "|".join(f"{clean_value(x):<{col_width}}" for x in values1)
+            row2 = "|".join(f"{clean_value(x):<{col_width}}" for x in values2)
+
+            diff_vals = []
+            for x, y in zip(values1, values2):
+                if pd.api.types.is_number(x) and pd.api.types.is_number(y):
+                    diff_vals.append(x - y)
+                else:
+                    diff_vals.append("nan")
+
+            row_diff = "|".join(f"{str(x):<{col_width}}" for x in diff_vals)
+
+            lines += [
+                f"id  : {index}",
+                f"ref  : {row1}",
+                f"cur  : {row2}",
+                f"diff : {row_diff}",
+                "",
+            ]
+        detailed_logger.info("\n".join(lines))
+
+    if n_diff > len(logged):
+        detailed_logger.info(
+            "%s more differing rows not written (limit %s)\n",
+            n_diff - len(logged),
+            max_logged_differences,
+        )
 
 
 def write_different_size_log(var, size1, size2, detailed_logger):
@@ -174,46 +537,260 @@ def write_different_size_log(var, size1, size2, detailed_logger):
     )
 
 
-def compare_var_and_attr_ds(ds1, ds2, detailed_logger):
+def compare_var_and_attr_ds(
+    ds1,
+    ds2,
+    detailed_logger,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+    identical_variables=frozenset(),
+    chunk_size=COMPARE_CHUNK_SIZE,
+):  # pylint: disable=too-many-positional-arguments
     """
     Variable by variable and attribute by attribute,
     comparison of the two datasets.
+    Variables listed in identical_variables, e.g. because their checksums
+    match, are counted as equal without comparing them. The variables are
+    compared in blocks of chunk_size rows, see process_var.
     """
 
     total_all, equal_all = 0, 0
-    list_to_skip = ["source", "i_body", "l_body", "veri_data", "record"]
 
     for var in set(ds1.data_vars).union(ds2.data_vars):
-        if var in ds1.data_vars and var in ds2.data_vars and var not in list_to_skip:
+        if var in UNCOMPARED_VARIABLES:
+            continue
 
-            total, equal = process_var(ds1, ds2, var, detailed_logger)
+        # variables with the same name as an attribute are compared twice
+        n_comparisons = (var in ds1.data_vars and var in ds2.data_vars) + (
+            var in ds1.attrs and var in ds2.attrs
+        )
+        for _ in range(n_comparisons):
+            if var in identical_variables:
+                total = equal = ds1[var].size
+            else:
+                total, equal = process_var(
+                    ds1, ds2, var, detailed_logger, max_logged_differences, chunk_size
+                )
             total_all += total
             equal_all += equal
 
-        if var in ds1.attrs and var in ds2.attrs and var not in list_to_skip:
+    return total_all, equal_all
 
-            total, equal = process_var(ds1, ds2, var, detailed_logger)
-            total_all += total
-            equal_all += equal
+
+def compare_sorted_columns(
+    columns1,
+    columns2,
+    names,
+    detailed_logger,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+    identical_variables=frozenset(),
+    chunk_size=COMPARE_CHUNK_SIZE,
+):  # pylint: disable=too-many-positional-arguments
+    """
+    Compare the columns names of sorted_feedback_columns of two datasets like
+    compare_var_and_attr_ds compares two datasets. The columns are read in
+    sorted order block by block of chunk_size rows, so that besides the sort
+    orders only one block of each column is in memory. The differing rows
+    are read again for the log file only. Returns the total number of values
+    and the number of equal ones.
+    """
+    total_all, equal_all = 0, 0
+
+    for var in names:
+        if var in UNCOMPARED_VARIABLES:
+            continue
+
+        (var1, order1), (var2, order2) = columns1[var], columns2[var]
+        if var in identical_variables:
+            total = equal = order1.size * int(np.prod(var1.shape[1:]))
+        elif order1.size == order2.size and var1.shape[1:] == var2.shape[1:]:
+            total, equal, diff = compare_arrays_chunked(
+                var1,
+                var2,
+                var,
+                chunk_size,
+                max_logged_differences,
+                orders=(order1, order2),
+            )
+            if total != equal:
+                logged = diff[:max_logged_differences]
+                write_lines_log(
+                    sorted_rows_dataset(columns1, names, logged),
+                    sorted_rows_dataset(columns2, names, logged),
+                    np.arange(logged.size),
+                    detailed_logger,
+                    max_logged_differences,
+                    n_diff=total - equal,
+                )
+        else:
+            size1 = order1.size * int(np.prod(var1.shape[1:]))
+            size2 = order2.size * int(np.prod(var2.shape[1:]))
+            total, equal = max(size1, size2), 0
+            write_different_size_log(var, size1, size2, detailed_logger)
+
+        total_all += total
+        equal_all += equal
 
     return total_all, equal_all
 
 
-def process_var(ds1, ds2, var, detailed_logger):
+def compare_cells_rules(
+    ref_df,
+    cur_df,
+    cols,
+    rules: dict[str, list[int]],
+    detailed_logger,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+):  # pylint: disable=too-many-positional-arguments
+    """
+    This function compares two DataFrames cell by cell for a selected set of columns.
+    For each row and column, it ignores values that are equal or whose differences
+    are allowed by predefined rules.
+    All other differences not admitted are stored in a log file, at most
+    max_logged_differences of them in detail followed by a count per column.
+    """
+    n_rows = min(len(ref_df), len(cur_df))
+    violations = np.empty((n_rows, len(cols)), dtype=bool)
+    for i, col in enumerate(cols):
+        val1 = ref_df[col].to_numpy()[:n_rows]
+        val2 = cur_df[col].to_numpy()[:n_rows]
+        allowed = rules.get(col, [])
+        admitted = (val1 == val2) | (np.isin(val1, allowed) & np.isin(val2, allowed))
+        violations[:, i] = ~admitted
+
+    # np.nonzero walks the mask row by row, like a cell by cell comparison
+    rows, col_indices = np.nonzero(violations)
+    for row_idx, i in zip(
+        rows[:max_logged_differences], col_indices[:max_logged_differences]
+    ):
+        detailed_logger.info(
+            "Values different and not admitted | "
+            "row=%s, column=%s, file1=%s, file2=%s",
+            row_idx,
+            cols[i],
+            ref_df[cols[i]].iloc[row_idx],
+            cur_df[cols[i]].iloc[row_idx],
+        )
+
+    if rows.size > max_logged_differences:
+        counts = violations.sum(axis=0)
+        detailed_logger.info(
+            "%s more differences not admitted, in total per column: %s",
+            rows.size - max_logged_differences,
+            ", ".join(f"{col}={n}" for col, n in zip(cols, counts) if n),
+        )
+
+    return bool(rows.size)
+
+
+def compare_sorted_columns_with_rules(
+    columns_ref,
+    columns_cur,
+    rules: dict[str, list[int]],
+    detailed_logger,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+    identical_variables=frozenset(),
+    chunk_size=COMPARE_CHUNK_SIZE,
+):  # pylint: disable=too-many-positional-arguments
+    """
+    Compare the reports and observations of sorted_feedback_columns, or of
+    DataFrames given by dataframe_columns, row by row and column by column.
+    Columns with rules are read as a whole and compared with
+    compare_cells_rules, all others block by block with compare_sorted_columns.
+    """
+    errors = False
+    for key, ref_columns in columns_ref.items():
+        cur_columns = columns_cur[key]
+        common_cols = [col for col in ref_columns if col in cur_columns]
+
+        cols_with_rules = [
+            col
+            for col in common_cols
+            if col in rules and col not in identical_variables
+        ]
+        cols_without_rules = [col for col in common_cols if col not in rules]
+
+        if cols_without_rules:
+            t, e = compare_sorted_columns(
+                ref_columns,
+                cur_columns,
+                cols_without_rules,
+                detailed_logger,
+                max_logged_differences,
+                identical_variables,
+                chunk_size,
+            )
+            if t != e:
+                return True
+
+        if cols_with_rules:
+            errors |= compare_cells_rules(
+                pd.DataFrame(
+                    {c: sorted_column_values(ref_columns[c]) for c in cols_with_rules}
+                ),
+                pd.DataFrame(
+                    {c: sorted_column_values(cur_columns[c]) for c in cols_with_rules}
+                ),
+                cols_with_rules,
+                rules,
+                detailed_logger,
+                max_logged_differences,
+            )
+    return errors
+
+
+def sorted_rows_dataset(columns, names, rows):
+    """
+    The given rows of the columns names of sorted_feedback_columns as a
+    Dataset indexed by the row numbers, like the rows of the DataFrames of
+    fof_dataframes converted with to_xarray.
+    """
+    return xr.Dataset(
+        {
+            name: xr.Variable(
+                ("index", *columns[name][0].dims[1:]),
+                sorted_column_values(columns[name], rows),
+            )
+            for name in names
+        },
+        coords={"index": rows},
+    )
+
+
+def process_var(
+    ds1,
+    ds2,
+    var,
+    detailed_logger,
+    max_logged_differences=MAX_LOGGED_DIFFERENCES,
+    chunk_size=COMPARE_CHUNK_SIZE,
+):  # pylint: disable=too-many-positional-arguments
     """
     This function first checks whether two arrays have the same size.
     If they do, their values are compared.
     If they don't, the differences are written to a log file.
     The function outputs the total number of elements and the
     number of matching elements.
+    Arrays of the same shape are compared in blocks of chunk_size rows, see
+    compare_arrays_chunked; with chunk_size None, they are compared at once.
     """
 
-    arr1 = replace_nan_with_sentinel_float64(ds1[var].values)
-    arr2 = replace_nan_with_sentinel_float64(ds2[var].values)
+    var1, var2 = ds1[var].variable, ds2[var].variable
+    if chunk_size and var1.ndim > 0 and var1.shape == var2.shape:
+        t, e, diff = compare_arrays_chunked(
+            var1, var2, var, chunk_size, max_logged_differences
+        )
+        if t != e:
+            write_lines_log(
+                ds1, ds2, diff, detailed_logger, max_logged_differences, n_diff=t - e
+            )
+        return t, e
+
+    arr1 = replace_nan_with_sentinel_float64(var1.values)
+    arr2 = replace_nan_with_sentinel_float64(var2.values)
     if arr1.size == arr2.size:
         t, e, diff = compare_arrays(arr1, arr2, var)
         if diff.size != 0:
-            write_lines_log(ds1, ds2, diff, detailed_logger)
+            write_lines_log(ds1, ds2, diff, detailed_logger, max_logged_differences)
 
     else:
         t, e = max(arr1.size, arr2.size), 0
@@ -222,6 +799,31 @@ def process_var(ds1, ds2, var, detailed_logger):
     return t, e
 
 
+def group_fof_tolerance(tolerance, df_groups):
+    """
+    Reduce the tolerance of each observation to the maximum tolerance of its
+    group, given by the columns of df_groups (e.g. varno and codetype).
+    Returns a table with one row per group, see expand_fof_tolerance.
+    """
+    keys = list(df_groups.columns)
+    df = df_groups.assign(veri_data=tolerance.to_numpy())
+    return df.groupby(keys)["veri_data"].max().reset_index()
+
+
+def expand_fof_tolerance(df_tol, df_groups):
+    """
+    Expand a table of tolerances per group, as computed by group_fof_tolerance,
+    to the observations whose group columns are given by df_groups. The veri
+    data of observations in groups missing from the table must be equal.
+    """
+    keys = list(df_groups.columns)
+    merged = df_groups.merge(
+        df_tol[keys + ["veri_data"]], how="left", on=keys, indicator=True
+    )
+    tolerance = merged["veri_data"].where(merged["_merge"] == "both", 0.0)
+    return tolerance.to_frame().set_axis(df_groups.index)
+
+
 def get_log_file_name(file_path):
     """
     This function gives the name of the detailed log file,
@@ -233,12 +835,22 @@ def get_log_file_name(file_path):
     return log_file_name
 
 
+def get_detailed_logger_name(log_file_name):
+    """
+    This function gives the name of the logger writing the detailed log file,
+    one per file so that comparisons running at the same time do not write
+    to each other's log files.
+    """
+
+    return f"DETAILS {log_file_name}"
+
+
 def clean_logger_file_if_only_details(file_path):
     """
     This function deletes the detailed log file if it doesn't
     contain anything.
     """
-    target_line = "initialized named logger 'DETAILS'"
+    target_line = f"initialized named logger '{get_detailed_logger_name(file_path)}'"
 
     with open(file_path, "r", encoding="utf-8") as f:
         lines = f.readlines()
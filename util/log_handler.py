@@ -7,7 +7,9 @@ This module provides functionality for:
 """
 
 import logging
+import os
 import sys
+from contextlib import contextmanager
 from typing import Optional
 
 import pandas as pd
@@ -45,7 +47,7 @@ def initialize_detailed_logger(
     existing_handlers = [
         h
         for h in detailed_logger.handlers
-        if getattr(h, "baseFilename", None) == log_file
+        if log_file and getattr(h, "baseFilename", None) == os.path.abspath(log_file)
     ]
 
     if existing_handlers:
@@ -62,6 +64,47 @@ def initialize_detailed_logger(
     return detailed_logger
 
 
+def close_detailed_logger(detailed_logger):
+    """
+    Close the log files of a logger created with initialize_detailed_logger,
+    so that a later initialization starts a new file.
+    """
+    for handler in list(detailed_logger.handlers):
+        detailed_logger.removeHandler(handler)
+        handler.close()
+
+
+class _RecordCollector(logging.Handler):
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def emit(self, record):
+        self.records.append((record.levelno, self.format(record)))
+
+
+@contextmanager
+def capture_log_records(log: logging.Logger = logger):
+    """
+    Collect the messages logged to log, instead of emitting them, as a list of
+    (level, message) tuples, e.g. to pass them from a worker process back to
+    the main process and emit them there in a deterministic order.
+    """
+    records: list = []
+    handlers = log.handlers
+    log.handlers = [_RecordCollector(records)]
+    try:
+        yield records
+    finally:
+        log.handlers = handlers
+
+
+def replay_log_records(records, log: logging.Logger = logger):
+    """Emit messages collected with capture_log_records."""
+    for level, message in records:
+        log.log(level, "%s", message)
+
+
 def log_dataframe(
     log: logging.Logger,
     title: str,
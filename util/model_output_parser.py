@@ -55,7 +55,7 @@ def parse_netcdf(
         if np.issubdtype(ds[v].dtype, np.floating):
             ds[v] = ds[v].astype(np.float64)
 
-    var_tmp = __get_variables(ds, time_dim, horizontal_dims)
+    var_tmp = get_variables(ds, time_dim, horizontal_dims)
 
     var_dfs = []
 
@@ -75,7 +75,7 @@ def parse_netcdf(
     return var_dfs
 
 
-def __get_variables(data, time_dim, horizontal_dims):
+def get_variables(data, time_dim, horizontal_dims):
     # return a list of variable names from the dataset data that have a time dimension
     # and horizontal dimension or in case there is no time dimension just the variables
     #  with horizontal dimension
@@ -1,6 +1,6 @@
 """
-This module provides a function to copy a NetCDF file while converting variable
-data types.
+This module provides a function to copy a NetCDF file while converting the data
+types of selected variables.
 """
 
 import numpy as np
@@ -8,8 +8,63 @@ from netCDF4 import Dataset  # pylint: disable=no-name-in-module
 
 from util.log_handler import logger
 
+# maximum number of bytes of a variable read and written at once
+COPY_CHUNK_BYTES = 1 << 26
 
-def nc4_get_copy(name_in, name_out):
+# compression filters which can be passed on to createVariable
+_COMPRESSION_FILTERS = ("zlib", "zstd", "bzip2")
+
+
+def storage_settings(in_var):
+    """
+    Return the createVariable keyword arguments which reproduce the chunking
+    and compression of in_var. Files in classic format have neither.
+    """
+    settings = {}
+
+    chunking = in_var.chunking()
+    if chunking == "contiguous":
+        settings["contiguous"] = True
+    elif chunking is not None:
+        settings["chunksizes"] = chunking
+
+    filters = in_var.filters()
+    if filters is not None:
+        for compression in _COMPRESSION_FILTERS:
+            if filters.get(compression):
+                settings["compression"] = compression
+                settings["complevel"] = filters["complevel"]
+        settings["shuffle"] = filters["shuffle"]
+        settings["fletcher32"] = filters["fletcher32"]
+
+    return settings
+
+
+def hyperslabs(shape, itemsize, chunk_bytes=COPY_CHUNK_BYTES):
+    """
+    Split an array of the given shape along its first dimension into slices of
+    at most chunk_bytes bytes, or of a single index if that is larger.
+    """
+    if not shape:
+        yield ()
+        return
+
+    row_bytes = itemsize * int(np.prod(shape[1:]))
+    step = max(1, chunk_bytes // max(row_bytes, 1))
+    for start in range(0, shape[0], step):
+        yield (slice(start, min(start + step, shape[0])),)
+
+
+def nc4_get_copy(name_in, name_out, promote_variables=None):
+    """
+    Copy the NetCDF file name_in to name_out and return the new file opened for
+    writing. The variables in promote_variables (all variables if None) are
+    converted to double precision, together with their single precision
+    attributes. All other variables keep their data type and are copied
+    bit for bit. Chunking and zlib, zstd or bzip2 compression are carried over.
+    The data is streamed in hyperslabs along the first dimension, so that only
+    a part of each variable is held in memory.
+    """
     din = Dataset(name_in, "r")
     logger.info("creating netCDF4 file: %s", name_out)
     d_out = Dataset(name_out, "w")
@@ -20,25 +75,40 @@ def nc4_get_copy(name_in, name_out):
 
     # Copy variables
     for v_name, in_var in din.variables.items():
-        # always create double precision output.
-        # Default is single which will not work for perturb.
-        out_var = d_out.createVariable(v_name, np.float64, in_var.dimensions)
-
-        # Copy variable attributes, make sure float32 attributes are created as float64
-        real_atts = [
-            k for k in in_var.ncattrs() if isinstance(in_var.getncattr(k), np.float32)
-        ]
-        ncdict = {
-            k: in_var.getncattr(k) for k in in_var.ncattrs() if k not in real_atts
-        }
-        ncdict_dbl = {
-            k: np.float64(in_var.getncattr(k))
-            for k in in_var.ncattrs()
-            if k in real_atts
-        }
-        out_var.setncatts({**ncdict, **ncdict_dbl})
-
-        out_var[:] = np.float64(in_var[:])
+        promote = promote_variables is None or v_name in promote_variables
+
+        if promote:
+            # create double precision output for the perturbed variables.
+            # Default is single which will not work for perturb.
+            out_var = d_out.createVariable(
+                v_name, np.float64, in_var.dimensions, **storage_settings(in_var)
+            )
+            # make sure float32 attributes are created as float64
+            out_var.setncatts(
+                {
+                    k: (
+                        np.float64(in_var.getncattr(k))
+                        if isinstance(in_var.getncattr(k), np.float32)
+                        or k == "_FillValue"
+                        else in_var.getncattr(k)
+                    )
+                    for k in in_var.ncattrs()
+                }
+            )
+        else:
+            out_var = d_out.createVariable(
+                v_name, in_var.datatype, in_var.dimensions, **storage_settings(in_var)
+            )
+            out_var.setncatts({k: in_var.getncattr(k) for k in in_var.ncattrs()})
+            # copy the raw values, without masking and rescaling
+            in_var.set_auto_maskandscale(False)
+            out_var.set_auto_maskandscale(False)
+
+        for hyperslab in hyperslabs(in_var.shape, np.dtype(in_var.dtype).itemsize):
+            values = in_var[hyperslab]
+            out_var[hyperslab] = np.float64(values) if promote else values
+
+        out_var.set_auto_maskandscale(True)
 
     # close the input file
     din.close()
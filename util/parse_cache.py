@@ -0,0 +1,168 @@
+"""
+This module provides a persistent on-disk cache for parsed input files.
+
+Reference and tolerance files rarely change between probtest invocations.
+The cache stores a pickled snapshot of the parsed data keyed by the content
+hash of the source file, so that these files only need to be parsed once.
+The cache directory is bounded in size; the least recently used snapshots are
+evicted first.
+
+Note that snapshots are unpickled when read, so the cache directory must only
+be writable by trusted users.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from util.log_handler import logger
+
+DEFAULT_CACHE_MAX_SIZE_MB = 1024
+
+# part of the snapshot keys, to be increased whenever the output of a parser
+# changes, so that snapshots of older versions of probtest are not used
+CACHE_FORMAT_VERSION = 1
+
+
+def file_content_hash(path, chunk_size=1 << 20):
+    """Compute the sha256 hash of the content of a file."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _write_atomic(path, write):
+    """Write to a temporary file first so that readers never see partial data."""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+
+
+class ParseCache:
+    """
+    Persistent cache of parsed files in the directory cache_dir.
+
+    For each source file a small stamp file records its size, modification
+    time and content hash, so that the hash only has to be recomputed when the
+    file has changed. Snapshots are named after the content hash and the
+    parser and are evicted in least recently used order once the total size
+    of all snapshots exceeds max_size_mb megabytes.
+    """
+
+    def __init__(self, cache_dir, max_size_mb=DEFAULT_CACHE_MAX_SIZE_MB):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        (self.cache_dir / "stamps").mkdir(parents=True, exist_ok=True)
+
+    def content_hash(self, path):
+        stat = os.stat(path)
+        abspath = os.path.abspath(path)
+        stamp_file = (
+            self.cache_dir
+            / "stamps"
+            / f"{hashlib.sha256(abspath.encode()).hexdigest()}.json"
+        )
+
+        try:
+            with open(stamp_file, "r", encoding="utf-8") as f:
+                stamp = json.load(f)
+            if (
+                stamp["path"] == abspath
+                and stamp["size"] == stat.st_size
+                and stamp["mtime_ns"] == stat.st_mtime_ns
+            ):
+                return stamp["sha256"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        sha = file_content_hash(path)
+        stamp = {
+            "path": abspath,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha,
+        }
+        _write_atomic(stamp_file, lambda f: f.write(json.dumps(stamp).encode()))
+        return sha
+
+    def snapshot_file(self, parse_function, path, kwargs):
+        parser = getattr(parse_function, "__qualname__", repr(parse_function))
+        key = "|".join(
+            [
+                f"v{CACHE_FORMAT_VERSION}",
+                self.content_hash(path),
+                f"{getattr(parse_function, '__module__', '')}.{parser}",
+                repr(sorted(kwargs.items())),
+                pd.__version__,
+            ]
+        )
+        return self.cache_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.pkl"
+
+    def load(self, parse_function, path, **kwargs):
+        """
+        Return parse_function(path, **kwargs), read from the cache if a
+        snapshot exists and stored in the cache otherwise.
+        """
+        try:
+            snapshot = self.snapshot_file(parse_function, path, kwargs)
+        except OSError as e:
+            logger.warning("parse cache %s not usable: %s", self.cache_dir, e)
+            return parse_function(path, **kwargs)
+
+        if snapshot.exists():
+            try:
+                with open(snapshot, "rb") as f:
+                    parsed = pickle.load(f)
+                # mark as recently used
+                os.utime(snapshot)
+                logger.debug("read %s from parse cache %s", path, snapshot)
+                return parsed
+            # pylint: disable-next=broad-exception-caught
+            except Exception as e:
+                # a broken snapshot or one written by incompatible versions of
+                # pandas, numpy or probtest raises all sorts of errors
+                logger.warning("ignoring broken parse cache entry %s: %s", snapshot, e)
+                snapshot.unlink(missing_ok=True)
+
+        parsed = parse_function(path, **kwargs)
+
+        try:
+            _write_atomic(
+                snapshot,
+                lambda f: pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL),
+            )
+            self.evict()
+        except OSError as e:
+            logger.warning("could not write parse cache entry %s: %s", snapshot, e)
+
+        return parsed
+
+    def evict(self):
+        """Remove the least recently used snapshots exceeding the size limit."""
+        snapshots = []
+        for snapshot in self.cache_dir.glob("*.pkl"):
+            try:
+                stat = snapshot.stat()
+            except OSError:  # removed concurrently
+                continue
+            snapshots.append((stat.st_mtime_ns, stat.st_size, snapshot))
+
+        total_size = sum(size for _, size, _ in snapshots)
+        for _, size, snapshot in sorted(snapshots):
+            if total_size <= self.max_size:
+                break
+            logger.debug("evicting %s from parse cache", snapshot)
+            snapshot.unlink(missing_ok=True)
+            total_size -= size
@@ -0,0 +1,98 @@
+"""
+This module provides a store for perturbation patterns.
+
+The perturbation of an ensemble member only depends on its seed, the
+perturbation amplitude and the shape of the perturbed variable. The store keeps
+each pattern in memory once it has been generated, so that it is applied to all
+variables and files on the same grid without being regenerated. With a
+directory, the parameters of each pattern are also recorded on disk, together
+with a checksum of the pattern. The pattern itself is not stored: regenerating
+it is exact and cheap, and the checksum verifies that later setups of the same
+experiment get the same perturbation.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from util.checksum import array_checksum
+from util.log_handler import logger
+
+
+class PatternStore:
+    """
+    Store of the patterns returned by pattern_function(shape, seed,
+    perturb_amplitude), kept in memory and, if store_dir is given, recorded
+    with their checksum in that directory. A pattern whose checksum differs
+    from the recorded one is reported, as it is not the perturbation of the
+    earlier setup.
+    """
+
+    def __init__(self, store_dir=None):
+        self.store_dir = None if store_dir is None else Path(store_dir)
+        self.patterns = {}
+        if self.store_dir is not None:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    def record_file(self, key):
+        return self.store_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def load(self, pattern_function, shape, seed, perturb_amplitude):
+        """Return the pattern, generated only if it is not in memory yet."""
+        shape = tuple(int(n) for n in shape)
+        function = pattern_function.__qualname__
+        parameters = {
+            "function": f"{pattern_function.__module__}.{function}",
+            "shape": shape,
+            "seed": int(seed),
+            "perturb_amplitude": repr(perturb_amplitude),
+        }
+        key = json.dumps(parameters)
+
+        if key in self.patterns:
+            return self.patterns[key]
+
+        pattern = pattern_function(shape, seed, perturb_amplitude)
+        if self.store_dir is not None:
+            self.verify(key, array_checksum(pattern))
+
+        self.patterns[key] = pattern
+        return pattern
+
+    def verify(self, key, checksum):
+        """
+        Compare the checksum of a generated pattern with the recorded one, or
+        record it if there is none yet.
+        """
+        record_file = self.record_file(key)
+        try:
+            with open(record_file, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.debug("no recorded perturbation pattern %s: %s", record_file, e)
+            self.write(record_file, {"key": key, "checksum": checksum})
+            return
+
+        if record.get("key") != key or record.get("checksum") != checksum:
+            logger.warning(
+                "perturbation pattern %s differs from the recorded one, the "
+                "perturbation is not the same as in the earlier setup",
+                record_file,
+            )
+        else:
+            logger.debug("verified perturbation pattern %s", record_file)
+
+    def write(self, record_file, record):
+        fd, tmp_name = tempfile.mkstemp(dir=self.store_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(record, f)
+            os.replace(tmp_name, record_file)
+        except OSError as e:
+            logger.warning(
+                "could not record perturbation pattern %s: %s", record_file, e
+            )
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)